@@ -0,0 +1,320 @@
+# batchGame.py
+# ------------
+# Runs many classic Pacman games in lockstep on NumPy arrays.
+
+"""
+A struct-of-arrays version of the classic Pacman rules for rollouts and data
+generation.  A BatchGameState holds N games on the same layout: agent
+positions, directions, scared timers, food and capsule bitmaps, scores and
+win/lose flags are NumPy arrays with the game as their first axis, and step()
+moves one agent in every game at once with the same semantics as
+PacmanRules and GhostRules in pacman.py.
+
+Positions are stored in half-steps (twice the board coordinate) so that the
+half-speed moves of scared ghosts stay exact integers.
+
+Run 'python batchGame.py' to check the batch engine against the scalar
+GameState on every bundled layout.
+"""
+
+import numpy as np
+from game import Actions, Directions
+from pacman import SCARED_TIME, COLLISION_TOLERANCE, TIME_PENALTY
+
+# Direction indices follow the order of Actions.getPossibleActions
+DIRECTIONS = [direction for direction, vector in Actions._directionsAsList]
+DIRECTION_INDEX = dict((direction, i) for i, direction in enumerate(DIRECTIONS))
+STOP = DIRECTION_INDEX[Directions.STOP]
+VECTORS = np.array([vector for direction, vector in Actions._directionsAsList], dtype=np.int64)
+
+# Manhattan distance, in half-steps, within which a ghost and Pacman collide
+COLLISION_HALF_STEPS = int(COLLISION_TOLERANCE * 2)
+
+
+class BatchGameState:
+    """
+    N games on one layout, advanced one agent at a time with step().  Agents
+    move in the usual order (Pacman, then each ghost); games that are won or
+    lost stay frozen while the others go on.
+    """
+
+    def __init__(self, layout, numGames, numGhostAgents=1000):
+        self.layout = layout
+        self.numGames = numGames
+        self.width = layout.width
+        self.height = layout.height
+        self._initializeTables()
+
+        # Agents, as chosen by GameStateData.initialize
+        starts = []
+        numGhosts = 0
+        for isPacman, pos in layout.agentPositions:
+            if not isPacman:
+                if numGhosts == numGhostAgents:
+                    continue
+                numGhosts += 1
+            starts.append(pos)
+        self.numAgents = len(starts)
+        self.startPositions = np.array(starts, dtype=np.int64) * 2
+        self.startDirections = np.full(self.numAgents, STOP, dtype=np.int64)
+
+        self.positions = np.repeat(self.startPositions[np.newaxis], numGames, axis=0)
+        self.directions = np.repeat(self.startDirections[np.newaxis], numGames, axis=0)
+        self.scaredTimers = np.zeros((numGames, self.numAgents), dtype=np.int64)
+
+        food = np.array([list(column) for column in layout.food], dtype=bool)
+        capsules = np.zeros((self.width, self.height), dtype=bool)
+        for x, y in layout.capsules:
+            capsules[x, y] = True
+        self.food = np.repeat(food[np.newaxis], numGames, axis=0)
+        self.capsules = np.repeat(capsules[np.newaxis], numGames, axis=0)
+        self.numFood = np.full(numGames, food.sum(), dtype=np.int64)
+
+        self.scores = np.zeros(numGames, dtype=np.int64)
+        self.wins = np.zeros(numGames, dtype=bool)
+        self.loses = np.zeros(numGames, dtype=bool)
+
+    def fromGameState(state, numGames):
+        """
+        Returns a batch of numGames copies of a scalar GameState.
+        """
+        data = state.data
+        batch = BatchGameState(data.layout, numGames, state.getNumAgents() - 1)
+        agents = data.agentStates
+        batch.startPositions = np.array([a.start.pos for a in agents]) * 2
+        batch.startPositions = np.rint(batch.startPositions).astype(np.int64)
+        batch.startDirections = np.array(
+            [DIRECTION_INDEX[a.start.direction] for a in agents], dtype=np.int64)
+
+        positions = np.rint(np.array([a.getPosition() for a in agents]) * 2).astype(np.int64)
+        directions = np.array([DIRECTION_INDEX[a.getDirection()] for a in agents], dtype=np.int64)
+        timers = np.array([a.scaredTimer for a in agents], dtype=np.int64)
+        food = np.array([list(column) for column in data.food], dtype=bool)
+        capsules = np.zeros((batch.width, batch.height), dtype=bool)
+        for x, y in data.capsules:
+            capsules[x, y] = True
+
+        batch.positions = np.repeat(positions[np.newaxis], numGames, axis=0)
+        batch.directions = np.repeat(directions[np.newaxis], numGames, axis=0)
+        batch.scaredTimers = np.repeat(timers[np.newaxis], numGames, axis=0)
+        batch.food = np.repeat(food[np.newaxis], numGames, axis=0)
+        batch.capsules = np.repeat(capsules[np.newaxis], numGames, axis=0)
+        batch.numFood = np.full(numGames, data.numFood, dtype=np.int64)
+        batch.scores = np.full(numGames, data.score, dtype=np.int64)
+        batch.wins = np.full(numGames, data._win, dtype=bool)
+        batch.loses = np.full(numGames, data._lose, dtype=bool)
+        return batch
+    fromGameState = staticmethod(fromGameState)
+
+    def _initializeTables(self):
+        """
+        Turns the layout's legal-move tables into arrays indexed by cell
+        (x * height + y), direction index and heading.
+        """
+        numCells = self.width * self.height
+        self.pacmanLegal = np.zeros((numCells, len(DIRECTIONS)), dtype=bool)
+        self.ghostLegal = np.zeros((numCells, len(DIRECTIONS), len(DIRECTIONS)), dtype=bool)
+        for (x, y), actions in self.layout.pacmanActions.items():
+            for action in actions:
+                self.pacmanLegal[x * self.height + y, DIRECTION_INDEX[action]] = True
+        for ((x, y), heading), actions in self.layout.ghostActions.items():
+            for action in actions:
+                self.ghostLegal[x * self.height + y, DIRECTION_INDEX[heading],
+                                DIRECTION_INDEX[action]] = True
+
+    def copy(self):
+        batch = BatchGameState.__new__(BatchGameState)
+        batch.__dict__.update(self.__dict__)
+        for name in ['positions', 'directions', 'scaredTimers', 'food', 'capsules',
+                     'numFood', 'scores', 'wins', 'loses']:
+            setattr(batch, name, getattr(self, name).copy())
+        return batch
+
+    ##################
+    # Batch accessors #
+    ##################
+
+    def isOver(self):
+        """
+        Returns a boolean array marking the games that are won or lost.
+        """
+        return self.wins | self.loses
+
+    def getPositions(self, agentIndex):
+        """
+        Returns an (N, 2) float array with the agent's board position in each game.
+        """
+        return self.positions[:, agentIndex] / 2.0
+
+    def legalActionMask(self, agentIndex):
+        """
+        Returns an (N, 5) boolean array of the agent's legal actions in each
+        game, with columns in the order of DIRECTIONS.  Finished games have
+        no legal actions.
+        """
+        positions = self.positions[:, agentIndex]
+        directions = self.directions[:, agentIndex]
+        onGrid = (positions % 2 == 0).all(axis=1)
+        cells = (positions[:, 0] // 2) * self.height + positions[:, 1] // 2
+        cells = np.clip(cells, 0, self.width * self.height - 1)
+        if agentIndex == 0:
+            mask = self.pacmanLegal[cells]
+        else:
+            mask = self.ghostLegal[cells, directions]
+
+        # In between grid points, all agents must continue straight
+        straight = np.zeros_like(mask)
+        straight[np.arange(self.numGames), directions] = True
+        mask = np.where(onGrid[:, np.newaxis], mask, straight)
+        mask[self.isOver()] = False
+        return mask
+
+    def randomLegalActions(self, agentIndex, rng=np.random):
+        """
+        Returns one uniformly random legal action index per game (STOP for
+        finished games).
+        """
+        mask = self.legalActionMask(agentIndex)
+        weights = np.where(mask, rng.random_sample(mask.shape), -1.0)
+        actions = weights.argmax(axis=1)
+        actions[~mask.any(axis=1)] = STOP
+        return actions
+
+    #########
+    # Rules #
+    #########
+
+    def step(self, agentIndex, actions):
+        """
+        Makes agentIndex take actions[i] (a DIRECTIONS index) in every game i
+        still in play, following PacmanRules and GhostRules.
+        """
+        actions = np.asarray(actions, dtype=np.int64)
+        active = ~self.isOver()
+        legal = self.legalActionMask(agentIndex)[np.arange(self.numGames), actions]
+        if not legal[active].all():
+            game = np.flatnonzero(active & ~legal)[0]
+            raise Exception("Illegal action %s in game %d" % (DIRECTIONS[actions[game]], game))
+
+        scoreChange = np.zeros(self.numGames, dtype=np.int64)
+        if agentIndex == 0:
+            self._movePacman(actions, active, scoreChange)
+            scoreChange[active] -= TIME_PENALTY
+            for ghostIndex in range(1, self.numAgents):
+                self._checkDeath(ghostIndex, active, scoreChange)
+        else:
+            self._moveGhost(agentIndex, actions, active)
+            self._decrementTimer(agentIndex, active)
+            self._checkDeath(agentIndex, active, scoreChange)
+        self.scores += scoreChange
+
+    def _move(self, agentIndex, actions, active, speed):
+        moving = active & (actions != STOP)
+        self.positions[:, agentIndex] += VECTORS[actions] * (speed * active)[:, np.newaxis]
+        self.directions[moving, agentIndex] = actions[moving]
+
+    def _movePacman(self, actions, active, scoreChange):
+        self._move(0, actions, active, np.full(self.numGames, 2, dtype=np.int64))
+
+        # Pacman only ever stands on grid points, so he always eats
+        games = np.arange(self.numGames)
+        x, y = self.positions[:, 0, 0] // 2, self.positions[:, 0, 1] // 2
+        eats = active & self.food[games, x, y]
+        scoreChange[eats] += 10
+        self.food[games[eats], x[eats], y[eats]] = False
+        self.numFood -= eats
+        won = eats & (self.numFood == 0) & ~self.loses
+        scoreChange[won] += 500
+        self.wins |= won
+
+        capsule = active & self.capsules[games, x, y]
+        self.capsules[games[capsule], x[capsule], y[capsule]] = False
+        self.scaredTimers[capsule, 1:] = SCARED_TIME
+
+    def _moveGhost(self, agentIndex, actions, active):
+        speed = np.where(self.scaredTimers[:, agentIndex] > 0, 1, 2)
+        self._move(agentIndex, actions, active, speed)
+
+    def _decrementTimer(self, agentIndex, active):
+        timers = self.scaredTimers[:, agentIndex]
+        snap = active & (timers == 1)
+        # nearestPoint, in half-steps
+        self.positions[snap, agentIndex] = (self.positions[snap, agentIndex] + 1) // 2 * 2
+        timers[active] = np.maximum(0, timers[active] - 1)
+
+    def _checkDeath(self, ghostIndex, active, scoreChange):
+        distance = np.abs(self.positions[:, ghostIndex] - self.positions[:, 0]).sum(axis=1)
+        collide = active & (distance <= COLLISION_HALF_STEPS)
+        scared = self.scaredTimers[:, ghostIndex] > 0
+
+        eaten = collide & scared
+        scoreChange[eaten] += 200
+        self.positions[eaten, ghostIndex] = self.startPositions[ghostIndex]
+        self.directions[eaten, ghostIndex] = self.startDirections[ghostIndex]
+        self.scaredTimers[eaten, ghostIndex] = 0
+
+        killed = collide & ~scared & ~self.wins
+        scoreChange[killed] -= 500
+        self.loses |= killed
+
+
+def checkParity(layout, numGames=16, maxMoves=300, seed=0, numGhostAgents=1000):
+    """
+    Plays numGames random games on both the scalar GameState and a
+    BatchGameState and checks that every agent move leaves them identical.
+    Returns the number of moves compared; raises AssertionError on a mismatch.
+    """
+    import random
+    from pacman import GameState
+
+    rng = random.Random(seed)
+    batch = BatchGameState(layout, numGames, numGhostAgents)
+    states = []
+    for i in range(numGames):
+        state = GameState()
+        state.initialize(layout, numGhostAgents)
+        states.append(state)
+
+    compared = 0
+    agentIndex = 0
+    for move in range(maxMoves):
+        mask = batch.legalActionMask(agentIndex)
+        actions = np.full(numGames, STOP, dtype=np.int64)
+        for i, state in enumerate(states):
+            if state.isWin() or state.isLose():
+                assert not mask[i].any(), "game %d: finished game has legal moves" % i
+                continue
+            legal = state.getLegalActions(agentIndex)
+            assert [DIRECTIONS[a] for a in np.flatnonzero(mask[i])] == legal, \
+                "game %d move %d: legal actions %s" % (i, move, legal)
+            action = rng.choice(legal)
+            actions[i] = DIRECTION_INDEX[action]
+            states[i] = state.generateSuccessor(agentIndex, action)
+        batch.step(agentIndex, actions)
+
+        for i, state in enumerate(states):
+            data = state.data
+            where = "game %d move %d" % (i, move)
+            for index, agent in enumerate(data.agentStates):
+                assert tuple(batch.positions[i, index]) == (agent.getPosition()[0] * 2, agent.getPosition()[1] * 2), where
+                assert DIRECTIONS[batch.directions[i, index]] == agent.getDirection(), where
+                assert batch.scaredTimers[i, index] == agent.scaredTimer, where
+            assert batch.scores[i] == data.score, where
+            assert batch.numFood[i] == data.numFood, where
+            assert batch.wins[i] == data._win and batch.loses[i] == data._lose, where
+            assert set(zip(*np.nonzero(batch.food[i]))) == data.foodPositions, where
+            assert set(zip(*np.nonzero(batch.capsules[i]))) == set(data.capsules), where
+            compared += 1
+        if batch.isOver().all():
+            break
+        agentIndex = (agentIndex + 1) % batch.numAgents
+    return compared
+
+
+if __name__ == '__main__':
+    import os
+    import layout as layouts
+
+    for name in sorted(os.listdir('layouts')):
+        compared = checkParity(layouts.getLayout(name))
+        print('%-24s %6d moves match' % (name, compared))
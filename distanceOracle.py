@@ -0,0 +1,146 @@
+# distanceOracle.py
+# -----------------
+# All-pairs maze distances for a layout.
+
+"""
+A DistanceOracle knows the maze distance (the length of the shortest path
+that does not cross a wall) between every two open cells of a layout.  The
+distances are found with one breadth-first search from every cell at once,
+run on NumPy arrays, and kept in an N x N matrix of 16-bit integers, N being
+the number of open cells.
+
+Building the matrix takes a fraction of a second on the bundled layouts, so
+it is also saved to disk, under a name made from a hash of the layout text,
+and loaded from there the next time.  Layout.getDistanceOracle keeps one
+oracle per layout text in memory.
+
+Positions must be cells, i.e. integer (x, y); round the position of a
+scared ghost with util.nearestPoint first.  Cells that cannot be reached
+from each other, and walls, are UNREACHABLE apart.
+"""
+
+import hashlib
+import os
+
+import numpy as np
+
+UNREACHABLE = np.iinfo(np.uint16).max
+
+DISTANCE_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'distanceCache')
+
+
+class DistanceOracle:
+
+    def __init__(self, layout, cacheDir=DISTANCE_CACHE_DIR):
+        walls = layout.walls
+        self.width, self.height = walls.width, walls.height
+        self.cells = [(x, y) for x in range(self.width) for y in range(self.height) if not walls[x][y]]
+        # Index of every open cell in the matrix, -1 for walls
+        self.cellIndex = np.full((self.width, self.height), -1, dtype=np.int32)
+        if self.cells:
+            xs, ys = zip(*self.cells)
+            self.cellIndex[xs, ys] = np.arange(len(self.cells), dtype=np.int32)
+        self._index = dict((cell, i) for i, cell in enumerate(self.cells))
+
+        self.distances = None
+        fileName = None
+        if cacheDir is not None:
+            textHash = hashlib.sha1('\n'.join(layout.layoutText).encode()).hexdigest()
+            fileName = os.path.join(cacheDir, textHash + '.npy')
+            self.distances = self._load(fileName)
+        if self.distances is None:
+            self.distances = self._search()
+            if fileName is not None:
+                self._save(fileName)
+
+    def _search(self):
+        """
+        Breadth-first search from every cell at once: row s of frontier
+        marks the cells at the current distance from source s.
+        """
+        numCells = len(self.cells)
+        neighbors = np.arange(numCells, dtype=np.int32)[:, np.newaxis].repeat(4, axis=1)
+        for i, (x, y) in enumerate(self.cells):
+            for k, (nx, ny) in enumerate(((x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1))):
+                if 0 <= nx < self.width and 0 <= ny < self.height and self.cellIndex[nx, ny] >= 0:
+                    neighbors[i, k] = self.cellIndex[nx, ny]
+
+        distances = np.full((numCells, numCells), UNREACHABLE, dtype=np.uint16)
+        frontier = np.eye(numCells, dtype=bool)
+        reached = frontier.copy()
+        np.fill_diagonal(distances, 0)
+        distance = 0
+        while frontier.any():
+            distance += 1
+            # A cell is on the next frontier if one of its neighbours is on this one
+            frontier = frontier[:, neighbors].any(axis=2)
+            frontier &= ~reached
+            distances[frontier] = distance
+            reached |= frontier
+        return distances
+
+    def _load(self, fileName):
+        if not os.path.exists(fileName):
+            return None
+        try:
+            distances = np.load(fileName)
+        except (OSError, ValueError):
+            return None
+        numCells = len(self.cells)
+        if distances.shape != (numCells, numCells) or distances.dtype != np.uint16:
+            return None
+        return distances
+
+    def _save(self, fileName):
+        """
+        Writes the matrix to a temporary file first, so a reader never sees
+        half of it.
+        """
+        try:
+            os.makedirs(os.path.dirname(fileName), exist_ok=True)
+            temporary = '%s.%d.tmp' % (fileName, os.getpid())
+            with open(temporary, 'wb') as f:
+                np.save(f, self.distances)
+            os.replace(temporary, fileName)
+        except OSError:
+            pass  # The cache is only an optimization
+
+    def dist(self, a, b):
+        """
+        Returns the maze distance between cells a and b.
+        """
+        i = self._index.get(a)
+        j = self._index.get(b)
+        if i is None or j is None:
+            return UNREACHABLE
+        return self.distances.item(i, j)
+
+    def distancesFrom(self, position, targets):
+        """
+        Returns the maze distances from position to each of targets (a list
+        of cells or an array of shape (k, 2)) as an integer array.
+        """
+        distances = np.full(len(targets), UNREACHABLE, dtype=np.int64)
+        i = self._index.get(position)
+        if i is None or len(targets) == 0:
+            return distances
+        targets = np.asarray(targets, dtype=np.int64).reshape(-1, 2)
+        inside = (targets[:, 0] >= 0) & (targets[:, 0] < self.width) & \
+                 (targets[:, 1] >= 0) & (targets[:, 1] < self.height)
+        columns = np.full(len(targets), -1, dtype=np.int64)
+        columns[inside] = self.cellIndex[targets[inside, 0], targets[inside, 1]]
+        isOpen = columns >= 0
+        distances[isOpen] = self.distances[i, columns[isOpen]]
+        return distances
+
+    def distanceMap(self, position):
+        """
+        Returns a (width, height) array of the maze distances from position
+        to every cell, UNREACHABLE at walls.
+        """
+        grid = np.full((self.width, self.height), UNREACHABLE, dtype=np.int64)
+        i = self._index.get(position)
+        if i is not None:
+            xs, ys = zip(*self.cells)
+            grid[xs, ys] = self.distances[i]
+        return grid
@@ -86,12 +86,31 @@ class Configuration:
 
     The convention for positions, like a graph, is that (0,0) is the lower left corner, x increases
     horizontally and y increases vertically.  Therefore, north is the direction of increasing y, or (0,1).
+
+    Configurations are never modified once built, so generateSuccessor hands
+    out one shared instance per (position, direction) through Configuration.get.
     """
+    __slots__ = ('pos', 'direction')
+
+    _interned = {}
 
     def __init__(self, pos, direction):
         self.pos = pos
         self.direction = direction
 
+    def get(pos, direction):
+        """
+        Returns the shared Configuration for pos and direction.
+        """
+        # (3, 5) and (3.0, 5.0) are equal keys, but the types must be kept
+        key = (pos, direction, type(pos[0]), type(pos[1]))
+        configuration = Configuration._interned.get(key)
+        if configuration is None:
+            configuration = Configuration(pos, direction)
+            Configuration._interned[key] = configuration
+        return configuration
+    get = staticmethod(get)
+
     def getPosition(self):
         return (self.pos)
 
@@ -103,7 +122,7 @@ class Configuration:
         return x == int(x) and y == int(y)
 
     def __eq__(self, other):
-        if other == None:
+        if other is None:
             return False
         return (self.pos == other.pos and self.direction == other.direction)
 
@@ -128,13 +147,15 @@ class Configuration:
         direction = Actions.vectorToDirection(vector)
         if direction == Directions.STOP:
             direction = self.direction  # There is no stop direction
-        return Configuration((x + dx, y+dy), direction)
+        return Configuration.get((x + dx, y+dy), direction)
 
 
 class AgentState:
     """
     AgentStates hold the state of an agent (configuration, speed, scared, etc).
     """
+    __slots__ = ('start', 'configuration', 'isPacman', 'scaredTimer',
+                 'numCarrying', 'numReturned')
 
     def __init__(self, startConfiguration, isPacman):
         self.start = startConfiguration
@@ -152,7 +173,7 @@ class AgentState:
             return "Ghost: " + str(self.configuration)
 
     def __eq__(self, other):
-        if other == None:
+        if other is None:
             return False
         return self.configuration == other.configuration and self.scaredTimer == other.scaredTimer
 
@@ -160,27 +181,33 @@ class AgentState:
         return hash(hash(self.configuration) + 13 * hash(self.scaredTimer))
 
     def copy(self):
-        state = AgentState(self.start, self.isPacman)
+        state = AgentState.__new__(AgentState)
+        state.start = self.start
         state.configuration = self.configuration
+        state.isPacman = self.isPacman
         state.scaredTimer = self.scaredTimer
         state.numCarrying = self.numCarrying
         state.numReturned = self.numReturned
         return state
 
     def getPosition(self):
-        if self.configuration == None:
+        if self.configuration is None:
             return None
-        return self.configuration.getPosition()
+        return self.configuration.pos
 
     def getDirection(self):
-        return self.configuration.getDirection()
+        return self.configuration.direction
 
 
 class Grid:
     """
-    A 2-dimensional array of objects backed by a list of lists.  Data is accessed
-    via grid[x][y] where (x,y) are positions on a Pacman map with x horizontal,
-    y vertical and the origin (0,0) in the bottom left corner.
+    A 2-dimensional array of booleans backed by an integer bitboard.  Data is
+    accessed via grid[x][y] where (x,y) are positions on a Pacman map with x
+    horizontal, y vertical and the origin (0,0) in the bottom left corner.
+
+    Cell (x,y) is stored in bit x * height + y of self.bits, so copying and
+    hashing a grid never walk its cells, count() is a popcount and asList()
+    only visits the cells that are set.
 
     The __str__ method constructs an output that is oriented like a pacman board.
     """
@@ -192,19 +219,31 @@ class Grid:
 
         self.width = width
         self.height = height
-        self.data = [[initialValue for y in range(
-            height)] for x in range(width)]
+        self.bits = self._fullMask() if initialValue else 0
         if bitRepresentation:
             self._unpackBits(bitRepresentation)
 
+    def _fullMask(self):
+        return (1 << (self.width * self.height)) - 1
+
     def __getitem__(self, i):
-        return self.data[i]
+        if i < 0:
+            i += self.width
+        if not 0 <= i < self.width:
+            raise IndexError('Grid column index out of range')
+        return GridColumn(self, i)
 
     def __setitem__(self, key, item):
-        self.data[key] = item
+        column = self[key]
+        for y, value in enumerate(item):
+            column[y] = value
+
+    def __iter__(self):
+        for x in range(self.width):
+            yield GridColumn(self, x)
 
     def __str__(self):
-        out = [[str(self.data[x][y])[0] for x in range(self.width)]
+        out = [[str(self[x][y])[0] for x in range(self.width)]
                for y in range(self.height)]
         out.reverse()
         return '\n'.join([''.join(x) for x in out])
@@ -212,41 +251,52 @@ class Grid:
     def __eq__(self, other):
         if other == None:
             return False
-        return self.data == other.data
+        return (self.bits == getattr(other, 'bits', None) and
+                self.width == other.width and self.height == other.height)
 
     def __hash__(self):
-        # return hash(str(self))
-        base = 1
-        h = 0
-        for l in self.data:
-            for i in l:
-                if i:
-                    h += base
-                base *= 2
-        return hash(h)
+        return hash(self.bits)
 
     def copy(self):
-        g = Grid(self.width, self.height)
-        g.data = [x[:] for x in self.data]
+        g = Grid.__new__(Grid)
+        g.CELLS_PER_INT = self.CELLS_PER_INT
+        g.width = self.width
+        g.height = self.height
+        g.bits = self.bits
         return g
 
     def deepCopy(self):
         return self.copy()
 
     def shallowCopy(self):
-        g = Grid(self.width, self.height)
-        g.data = self.data
-        return g
+        # Integers are immutable, so a copy already shares its storage.
+        return self.copy()
+
+    def get(self, x, y):
+        """
+        Returns grid[x][y] for a cell (x, y) inside the grid, testing its bit
+        without building a GridColumn; for loops over many cells.
+        """
+        return (self.bits >> (x * self.height + y)) & 1 == 1
 
     def count(self, item=True):
-        return sum([x.count(item) for x in self.data])
+        setBits = bin(self.bits).count('1')
+        if item:
+            return setBits
+        return self.width * self.height - setBits
 
     def asList(self, key=True):
+        bits = self.bits if key else self.bits ^ self._fullMask()
+        height = self.height
+        columnMask = (1 << height) - 1
         list = []
+        # A column at a time, so each step works on a small integer
         for x in range(self.width):
-            for y in range(self.height):
-                if self[x][y] == key:
-                    list.append((x, y))
+            column = (bits >> (x * height)) & columnMask
+            while column:
+                lowest = column & -column
+                list.append((x, lowest.bit_length() - 1))
+                column ^= lowest
         return list
 
     def packBits(self):
@@ -259,8 +309,7 @@ class Grid:
         currentInt = 0
         for i in range(self.height * self.width):
             bit = self.CELLS_PER_INT - (i % self.CELLS_PER_INT) - 1
-            x, y = self._cellIndexToPosition(i)
-            if self[x][y]:
+            if (self.bits >> i) & 1:
                 currentInt += 2 ** bit
             if (i + 1) % self.CELLS_PER_INT == 0:
                 bits.append(currentInt)
@@ -269,7 +318,7 @@ class Grid:
         return tuple(bits)
 
     def _cellIndexToPosition(self, index):
-        x = index / self.height
+        x = index // self.height
         y = index % self.height
         return x, y
 
@@ -282,8 +331,10 @@ class Grid:
             for bit in self._unpackInt(packed, self.CELLS_PER_INT):
                 if cell == self.width * self.height:
                     break
-                x, y = self._cellIndexToPosition(cell)
-                self[x][y] = bit
+                if bit:
+                    self.bits |= 1 << cell
+                else:
+                    self.bits &= ~(1 << cell)
                 cell += 1
 
     def _unpackInt(self, packed, size):
@@ -300,6 +351,50 @@ class Grid:
         return bools
 
 
+class GridColumn:
+    """
+    A view of column x of a Grid, so that grid[x][y] reads and writes bits.
+    """
+    __slots__ = ('grid', 'offset')
+
+    def __init__(self, grid, x):
+        self.grid = grid
+        self.offset = x * grid.height
+
+    def _bit(self, y):
+        height = self.grid.height
+        if y < 0:
+            y += height
+        if not 0 <= y < height:
+            raise IndexError('Grid row index out of range')
+        return 1 << (self.offset + y)
+
+    def __getitem__(self, y):
+        grid = self.grid
+        if 0 <= y < grid.height:
+            return (grid.bits >> (self.offset + y)) & 1 == 1
+        return grid.bits & self._bit(y) != 0
+
+    def __setitem__(self, y, value):
+        if value not in [False, True]:
+            raise Exception('Grids can only contain booleans')
+        if value:
+            self.grid.bits |= self._bit(y)
+        else:
+            self.grid.bits &= ~self._bit(y)
+
+    def __len__(self):
+        return self.grid.height
+
+    def __iter__(self):
+        bits = self.grid.bits >> self.offset
+        for y in range(self.grid.height):
+            yield (bits >> y) & 1 == 1
+
+    def count(self, item=True):
+        return list(self).count(item)
+
+
 def reconstituteGrid(bitRep):
     if type(bitRep) is not type((1, 2)):
         return bitRep
@@ -388,7 +483,7 @@ class Actions:
             next_y = y_int + dy
             if next_y < 0 or next_y == walls.height:
                 continue
-            if not walls[next_x][next_y]:
+            if not walls.get(next_x, next_y):
                 neighbors.append((next_x, next_y))
         return neighbors
     getLegalNeighbors = staticmethod(getLegalNeighbors)
@@ -400,20 +495,80 @@ class Actions:
     getSuccessor = staticmethod(getSuccessor)
 
 
+class Zobrist:
+    """
+    Random 64-bit keys for the features of a game state (an agent's
+    configuration, a scared timer, a food pellet, a capsule).  A state's
+    Zobrist key is the XOR of the keys of its features, so a move updates it
+    by XOR-ing out what it removes and XOR-ing in what it adds.
+
+    Keys are drawn lazily from a private generator with a fixed seed, so they
+    are the same from run to run and never disturb the random module.
+    """
+    MASK = 0xFFFFFFFFFFFFFFFF
+    SCORE_MULTIPLIER = 0x9E3779B97F4A7C15
+
+    _keys = {}
+    _random = random.Random(188)
+
+    def key(feature):
+        try:
+            return Zobrist._keys[feature]
+        except KeyError:
+            key = Zobrist._random.getrandbits(64)
+            Zobrist._keys[feature] = key
+            return key
+    key = staticmethod(key)
+
+    def agentKey(index, agentState):
+        configuration = agentState.configuration
+        scared = ('scared', index, agentState.scaredTimer)
+        if configuration is None:
+            return Zobrist.key(scared)
+        agent = ('agent', index, configuration.pos, configuration.direction)
+        keys = Zobrist._keys
+        if agent in keys and scared in keys:
+            return keys[agent] ^ keys[scared]
+        return Zobrist.key(agent) ^ Zobrist.key(scared)
+    agentKey = staticmethod(agentKey)
+
+    def foodKey(position):
+        return Zobrist.key(('food', position))
+    foodKey = staticmethod(foodKey)
+
+    def capsuleKey(position):
+        return Zobrist.key(('capsule', position))
+    capsuleKey = staticmethod(capsuleKey)
+
+
 class GameStateData:
 
     def __init__(self, prevState=None):
         """
         Generates a new data packet by copying information from its predecessor.
+
+        The food grid, the capsule list and the AgentStates themselves are
+        shared with the predecessor, copy-on-write: rules must replace the
+        food grid or capsule list rather than edit it, and must obtain an
+        AgentState through mutableAgentState before changing it.
         """
         if prevState != None:
-            self.food = prevState.food.shallowCopy()
-            self.capsules = prevState.capsules[:]
-            self.agentStates = self.copyAgentStates(prevState.agentStates)
+            self.food = prevState.food
+            self.capsules = prevState.capsules
+            self.agentStates = prevState.agentStates[:]
             self.layout = prevState.layout
             self._eaten = prevState._eaten
             self.score = prevState.score
+            self.numFood = prevState.numFood
+            self.foodPositions = prevState.foodPositions
+            self.zobrist = prevState.zobrist
+
+        self.clearChanges()
 
+    def clearChanges(self):
+        """
+        Resets the record of what the last move changed.
+        """
         self._foodEaten = None
         self._foodAdded = None
         self._capsuleEaten = None
@@ -421,9 +576,75 @@ class GameStateData:
         self._lose = False
         self._win = False
         self.scoreChange = 0
+        # Bitmask of the agentStates already copied for this data packet
+        self._mutableAgents = 0
+
+    def saveChanges(self):
+        """
+        Returns everything a move can change, for restoreChanges.  Because
+        moves replace the food grid, capsule list and AgentStates instead of
+        editing them, saving references is enough.
+        """
+        return (self.agentStates[:], self.food, self.numFood, self.foodPositions,
+                self.zobrist, self.capsules, self.score, self.scoreChange, self._eaten,
+                self._foodEaten, self._foodAdded, self._capsuleEaten,
+                self._agentMoved, self._lose, self._win, self._mutableAgents)
+
+    def restoreChanges(self, saved):
+        (self.agentStates, self.food, self.numFood, self.foodPositions,
+         self.zobrist, self.capsules, self.score, self.scoreChange, self._eaten,
+         self._foodEaten, self._foodAdded, self._capsuleEaten,
+         self._agentMoved, self._lose, self._win, self._mutableAgents) = saved
+
+    def mutableAgentState(self, index):
+        """
+        Returns agentStates[index], first replacing it with a private copy if
+        it may still be shared with another data packet.
+        """
+        mask = 1 << index
+        if not self._mutableAgents & mask:
+            agentState = self.agentStates[index]
+            # Its key is folded back in by rehashChangedAgents
+            self.zobrist ^= Zobrist.agentKey(index, agentState)
+            self.agentStates[index] = agentState.copy()
+            self._mutableAgents |= mask
+        return self.agentStates[index]
+
+    def rehashChangedAgents(self):
+        """
+        Adds the keys of the AgentStates handed out by mutableAgentState back
+        into the Zobrist key.  Called once a move has finished editing them.
+        """
+        for index in range(len(self.agentStates)):
+            if self._mutableAgents & (1 << index):
+                self.zobrist ^= Zobrist.agentKey(index, self.agentStates[index])
+        self._mutableAgents = 0
+
+    def computeZobrist(self):
+        """
+        Computes the Zobrist key of this data packet from scratch.
+        """
+        key = 0
+        for index, agentState in enumerate(self.agentStates):
+            key ^= Zobrist.agentKey(index, agentState)
+        for position in self.food.asList():
+            key ^= Zobrist.foodKey(position)
+        for position in self.capsules:
+            key ^= Zobrist.capsuleKey(position)
+        return key
+
+    def zobristKey(self):
+        """
+        Returns a 64-bit key for the agents, scared timers, food, capsules
+        and score of this state.  Equal states have equal keys, and distinct
+        states collide with negligible probability.
+        """
+        return self.zobrist ^ (self.score * Zobrist.SCORE_MULTIPLIER) & Zobrist.MASK
 
     def deepCopy(self):
         state = GameStateData(self)
+        state.agentStates = self.copyAgentStates(self.agentStates)
+        state.capsules = self.capsules[:]
         state.food = self.food.deepCopy()
         state.layout = self.layout.deepCopy()
         state._agentMoved = self._agentMoved
@@ -459,23 +680,17 @@ class GameStateData:
         """
         Allows states to be keys of dictionaries.
         """
-        for i, state in enumerate(self.agentStates):
-            try:
-                int(hash(state))
-            except TypeError as e:
-                print(e)
-                # hash(state)
-        return int((hash(tuple(self.agentStates)) + 13*hash(self.food) + 113 * hash(tuple(self.capsules)) + 7 * hash(self.score)) % 1048575)
+        return hash(self.zobristKey())
 
     def __str__(self):
         width, height = self.layout.width, self.layout.height
-        map = Grid(width, height)
+        map = [[None for y in range(height)] for x in range(width)]
         if type(self.food) == type((1, 2)):
             self.food = reconstituteGrid(self.food)
+        food, walls = self.food, self.layout.walls
         for x in range(width):
             for y in range(height):
-                food, walls = self.food, self.layout.walls
-                map[x][y] = self._foodWallStr(food[x][y], walls[x][y])
+                map[x][y] = self._foodWallStr(food.get(x, y), walls.get(x, y))
 
         for agentState in self.agentStates:
             if agentState == None:
@@ -492,7 +707,10 @@ class GameStateData:
         for x, y in self.capsules:
             map[x][y] = 'o'
 
-        return str(map) + ("\nScore: %d\n" % self.score)
+        out = [''.join([map[x][y] for x in range(width)])
+               for y in range(height)]
+        out.reverse()
+        return '\n'.join(out) + ("\nScore: %d\n" % self.score)
 
     def _foodWallStr(self, hasFood, hasWall):
         if hasFood:
@@ -526,6 +744,8 @@ class GameStateData:
         Creates an initial game state from a layout array (see layout.py).
         """
         self.food = layout.food.copy()
+        self.numFood = self.food.count()
+        self.foodPositions = frozenset(self.food.asList())
         #self.capsules = []
         self.capsules = layout.capsules[:]
         self.layout = layout
@@ -543,6 +763,7 @@ class GameStateData:
             self.agentStates.append(AgentState(
                 Configuration(pos, Directions.STOP), isPacman))
         self._eaten = [False for a in self.agentStates]
+        self.zobrist = self.computeZobrist()
 
 
 try:
@@ -557,7 +778,7 @@ class Game:
     The Game manages the control flow, soliciting actions from agents.
     """
 
-    def __init__(self, agents, display, rules, startingIndex=0, muteAgents=False, catchExceptions=False):
+    def __init__(self, agents, display, rules, startingIndex=0, muteAgents=False, catchExceptions=False, headless=False):
         ###################################################
         # Ahmed 
         ###################################################
@@ -571,6 +792,7 @@ class Game:
         self.gameOver = False
         self.muteAgents = muteAgents
         self.catchExceptions = catchExceptions
+        self.headless = headless
         self.moveHistory = []
         self.totalAgentTimes = [0 for agent in agents]
         self.totalAgentTimeWarnings = [0 for agent in agents]
@@ -617,6 +839,9 @@ class Game:
         """
         Main control loop for game play.
         """
+        if self.headless and not self.catchExceptions and not self.muteAgents:
+            return self._runHeadless()
+
         self.display.initialize(self.state.data)
         self.numMoves = 0
 
@@ -803,3 +1028,62 @@ class Game:
                     self.unmute()
                     return
         self.display.finish()
+
+    def _runHeadless(self):
+        """
+        Control loop for games with a null display and no timeouts or
+        muting, such as -q runs.  Agents receive views of the state instead
+        of deep copies (see GameState.view: they must not edit the objects
+        the view shares with the live state), their optional methods are
+        looked up once per game, and no display or mute calls are made per
+        move.
+        """
+        self.display.initialize(self.state.data)
+        self.numMoves = 0
+
+        for i, agent in enumerate(self.agents):
+            if not agent:
+                # this is a null agent, meaning it failed to load
+                # the other team wins
+                print("Agent %d failed to load" % i, file=sys.stderr)
+                self._agentCrash(i, quiet=True)
+                return
+            if hasattr(agent, 'registerInitialState'):
+                agent.registerInitialState(self.state.view())
+
+        getActions = [agent.getAction for agent in self.agents]
+        observationFunctions = [getattr(agent, 'observationFunction', None)
+                                for agent in self.agents]
+        agentIndex = self.startingIndex
+        numAgents = len(self.agents)
+
+        while not self.gameOver:
+            # The state before the action; generateSuccessor never edits it
+            current_state = self.state
+
+            observationFunction = observationFunctions[agentIndex]
+            if observationFunction != None:
+                observation = observationFunction(current_state.view())
+            else:
+                observation = current_state.view()
+
+            action = getActions[agentIndex](observation)
+
+            self.moveHistory.append((agentIndex, action))
+            self.state = current_state.generateSuccessor(agentIndex, action)
+
+            if self.data_collector and agentIndex == 0:
+                self.data_collector.capture_step(agentIndex, current_state, action, self.state)
+
+            self.rules.process(self.state, self)
+            if agentIndex == numAgents + 1:
+                self.numMoves += 1
+            agentIndex = (agentIndex + 1) % numAgents
+
+            if _BOINC_ENABLED:
+                boinc.set_fraction_done(self.getProgress())
+
+        for agent in self.agents:
+            if hasattr(agent, 'final'):
+                agent.final(self.state)
+        self.display.finish()
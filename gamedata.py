@@ -26,18 +26,13 @@ class GameDataCollector:
         # Crear una matriz vacía llena de espacios
         game_map = [[' ' for _ in range(height)] for _ in range(width)]
         
-        # Agregar paredes (%)
-        for x in range(width):
-            for y in range(height):
-                if walls[x][y]:
-                    game_map[x][y] = '%'
+        # Agregar paredes (%), recorriendo solo las casillas marcadas
+        for x, y in walls.asList():
+            game_map[x][y] = '%'
         
         # Agregar comida (.)
-        food = state.getFood()
-        for x in range(width):
-            for y in range(height):
-                if food[x][y]:
-                    game_map[x][y] = '.'
+        for x, y in state.getFood().asList():
+            game_map[x][y] = '.'
         
         # Agregar cápsulas (o)
         for x, y in state.getCapsules():
@@ -18,7 +18,8 @@ import os
 import random
 from functools import reduce
 
-VISIBILITY_MATRIX_CACHE = {}
+LEGAL_ACTIONS_CACHE = {}
+DISTANCE_ORACLE_CACHE = {}
 
 
 class Layout:
@@ -37,34 +38,79 @@ class Layout:
         self.processLayoutText(layoutText)
         self.layoutText = layoutText
         self.totalFood = len(self.food.asList())
-        # self.initializeVisibilityMatrix()
+        self.initializeLegalActions()
+        self.distanceOracle = None
 
     def getNumGhosts(self):
         return self.numGhosts
 
-    def initializeVisibilityMatrix(self):
-        global VISIBILITY_MATRIX_CACHE
-        if reduce(str.__add__, self.layoutText) not in VISIBILITY_MATRIX_CACHE:
-            from game import Directions
-            vecs = [(-0.5, 0), (0.5, 0), (0, -0.5), (0, 0.5)]
-            dirs = [Directions.NORTH, Directions.SOUTH,
-                    Directions.WEST, Directions.EAST]
-            vis = Grid(self.width, self.height, {Directions.NORTH: set(), Directions.SOUTH: set(
-            ), Directions.EAST: set(), Directions.WEST: set(), Directions.STOP: set()})
+    def initializeLegalActions(self):
+        """
+        Precomputes the legal actions at every open cell: for Pacman, keyed by
+        (x,y), and for ghosts, keyed by ((x,y), direction) where direction is
+        the one the ghost is travelling in.  Actions are listed in the same
+        order as Actions.getPossibleActions returns them.
+        """
+        global LEGAL_ACTIONS_CACHE
+        key = reduce(str.__add__, self.layoutText)
+        if key not in LEGAL_ACTIONS_CACHE:
+            from game import Actions, Directions
+            pacmanActions = {}
+            ghostActions = {}
             for x in range(self.width):
                 for y in range(self.height):
-                    if self.walls[x][y] == False:
-                        for vec, direction in zip(vecs, dirs):
-                            dx, dy = vec
-                            nextx, nexty = x + dx, y + dy
-                            while (nextx + nexty) != int(nextx) + int(nexty) or not self.walls[int(nextx)][int(nexty)]:
-                                vis[x][y][direction].add((nextx, nexty))
-                                nextx, nexty = x + dx, y + dy
-            self.visibility = vis
-            VISIBILITY_MATRIX_CACHE[reduce(str.__add__, self.layoutText)] = vis
-        else:
-            self.visibility = VISIBILITY_MATRIX_CACHE[reduce(
-                str.__add__, self.layoutText)]
+                    if self.walls.get(x, y):
+                        continue
+                    possible = []
+                    for direction, (dx, dy) in Actions._directionsAsList:
+                        nextx, nexty = x + dx, y + dy
+                        if 0 <= nextx < self.width and 0 <= nexty < self.height \
+                                and not self.walls.get(nextx, nexty):
+                            possible.append(direction)
+                    pacmanActions[(x, y)] = tuple(possible)
+
+                    # Ghosts cannot stop, and only turn around at dead ends
+                    moves = [d for d in possible if d != Directions.STOP]
+                    for heading in Directions.REVERSE:
+                        reverse = Actions.reverseDirection(heading)
+                        if reverse in moves and len(moves) > 1:
+                            legal = [d for d in moves if d != reverse]
+                        else:
+                            legal = moves
+                        ghostActions[((x, y), heading)] = tuple(legal)
+            LEGAL_ACTIONS_CACHE[key] = (pacmanActions, ghostActions)
+        self.pacmanActions, self.ghostActions = LEGAL_ACTIONS_CACHE[key]
+
+    def getDistanceOracle(self):
+        """
+        Returns the DistanceOracle with the maze distances between all open
+        cells, built on first use and shared by all layouts with the same
+        text.
+        """
+        if self.distanceOracle is None:
+            global DISTANCE_ORACLE_CACHE
+            key = reduce(str.__add__, self.layoutText)
+            if key not in DISTANCE_ORACLE_CACHE:
+                from distanceOracle import DistanceOracle
+                DISTANCE_ORACLE_CACHE[key] = DistanceOracle(self)
+            self.distanceOracle = DISTANCE_ORACLE_CACHE[key]
+        return self.distanceOracle
+
+    def __getstate__(self):
+        """
+        The legal action tables and distance oracle are most of a pickled
+        layout, and can be rebuilt from the layout text, so they are left
+        out.
+        """
+        state = self.__dict__.copy()
+        del state['pacmanActions']
+        del state['ghostActions']
+        state['distanceOracle'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.initializeLegalActions()
 
     def isWall(self, pos):
         x, col = pos
@@ -89,10 +135,6 @@ class Layout:
         dist, pos = max([(manhattanDistance(p, pacPos), p) for p in poses])
         return pos
 
-    def isVisibleFrom(self, ghostPos, pacPos, pacDirection):
-        row, col = [int(x) for x in pacPos]
-        return ghostPos in self.visibility[row][col][pacDirection]
-
     def __str__(self):
         return "\n".join(self.layoutText)
 
@@ -113,10 +155,19 @@ class Layout:
         Other characters are ignored.
         """
         maxY = self.height - 1
+        # Walls and food go straight into the grids' bits, in one pass
+        wallBits = foodBits = 0
         for y in range(self.height):
             for x in range(self.width):
                 layoutChar = layoutText[maxY - y][x]
-                self.processLayoutChar(x, y, layoutChar)
+                if layoutChar == '%':
+                    wallBits |= 1 << (x * self.height + y)
+                elif layoutChar == '.':
+                    foodBits |= 1 << (x * self.height + y)
+                else:
+                    self.processLayoutChar(x, y, layoutChar)
+        self.walls.bits |= wallBits
+        self.food.bits |= foodBits
         self.agentPositions.sort()
         self.agentPositions = [(i == 0, pos) for i, pos in self.agentPositions]
 
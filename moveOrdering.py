@@ -0,0 +1,130 @@
+# moveOrdering.py
+# ---------------
+# Move ordering heuristics for the alpha-beta agents.
+
+"""
+Alpha-beta prunes the most when the best move at a node is searched first.
+A MoveOrdering sorts the legal actions at a node with any of these
+heuristics, named when the ordering is built:
+
+  killer   moves that caused a cutoff at the same ply earlier in the search
+           (two per ply, most recent first)
+  history  moves that caused cutoffs anywhere, by (agent, position, action),
+           weighted by the remaining depth squared and halved every move
+  static   ghosts try the moves that bring them closest to Pacman first (or
+           furthest, when scared)
+
+Killer moves come first, then the rest by history score, with the static
+order breaking ties.  The agent puts the principal variation move in front
+of all of these.
+"""
+
+from game import Actions
+from util import manhattanDistance
+
+MOVE_ORDERINGS = ['killer', 'history', 'static']
+
+
+class MoveOrdering:
+
+    def __init__(self, heuristics=MOVE_ORDERINGS):
+        if 'all' in heuristics:
+            heuristics = MOVE_ORDERINGS
+        for heuristic in heuristics:
+            if heuristic not in MOVE_ORDERINGS:
+                raise Exception('Unknown move ordering %s; use all or some of %s' %
+                                (heuristic, '+'.join(MOVE_ORDERINGS)))
+        self.useKillers = 'killer' in heuristics
+        self.useHistory = 'history' in heuristics
+        self.useStatic = 'static' in heuristics
+        self.clear()
+
+    def clear(self):
+        """
+        Forgets everything learned, for a new game.
+        """
+        self.killers = {}
+        self.history = {}
+        self.ghostOrders = {}
+
+    def newSearch(self, shift=0):
+        """
+        Called before each move: killer moves are tied to plies of the
+        previous search and are dropped, or moved up shift plies if the new
+        root lies that deep in the previous tree.  History scores decay.
+        """
+        self.killers = dict((ply - shift, killers) for ply, killers in self.killers.items()
+                            if shift and ply > shift)
+        for key in list(self.history.keys()):
+            score = self.history[key] // 2
+            if score:
+                self.history[key] = score
+            else:
+                del self.history[key]
+
+    def agentPosition(gameState, agentIndex):
+        return gameState.data.agentStates[agentIndex].configuration.pos
+    agentPosition = staticmethod(agentPosition)
+
+    def order(self, gameState, agentIndex, ply, legalActions):
+        """
+        Returns legalActions sorted so the likeliest cutoffs come first.
+        Each pass below is a stable sort of the previous one, so killers
+        end up first, then history, then the static order, and remaining
+        ties keep their order in legalActions.
+        """
+        if len(legalActions) < 2:
+            return legalActions
+
+        position = MoveOrdering.agentPosition(gameState, agentIndex)
+        if self.useStatic and agentIndex > 0:
+            legalActions = self.ghostOrder(gameState, agentIndex, position, legalActions)
+
+        if self.useHistory:
+            history = self.history
+            scores = [history.get((agentIndex, position, action), 0) for action in legalActions]
+            if any(scores):
+                ranked = sorted(range(len(legalActions)), key=lambda i: -scores[i])
+                legalActions = [legalActions[i] for i in ranked]
+
+        if self.useKillers:
+            killers = self.killers.get(ply)
+            if killers:
+                first = [action for action in killers if action in legalActions]
+                if first:
+                    legalActions = first + [action for action in legalActions if action not in first]
+
+        return legalActions
+
+    def ghostOrder(self, gameState, agentIndex, position, legalActions):
+        """
+        Sorts a ghost's actions by the distance to Pacman they lead to:
+        nearest first, or furthest first when the ghost is scared.  The
+        order only depends on the positions, so it is cached.
+        """
+        scared = gameState.data.agentStates[agentIndex].scaredTimer > 0
+        pacmanPosition = gameState.getPacmanPosition()
+        key = (position, pacmanPosition, scared, tuple(legalActions))
+        ordered = self.ghostOrders.get(key)
+        if ordered is None:
+            speed = 0.5 if scared else 1.0
+            distances = []
+            for action in legalActions:
+                dx, dy = Actions.directionToVector(action, speed)
+                distance = manhattanDistance((position[0] + dx, position[1] + dy), pacmanPosition)
+                distances.append(-distance if scared else distance)
+            ranked = sorted(range(len(legalActions)), key=lambda i: distances[i])
+            ordered = self.ghostOrders[key] = [legalActions[i] for i in ranked]
+        return ordered
+
+    def recordCutoff(self, gameState, agentIndex, ply, action, remainingDepth):
+        """
+        Notes that action caused a cutoff at this node.
+        """
+        if self.useKillers:
+            killers = self.killers.get(ply, ())
+            if not killers or killers[0] != action:
+                self.killers[ply] = (action,) + killers[:1]
+        if self.useHistory:
+            key = (agentIndex, MoveOrdering.agentPosition(gameState, agentIndex), action)
+            self.history[key] = self.history.get(key, 0) + remainingDepth * remainingDepth
@@ -11,16 +11,26 @@
 # Student side autograding was added by Brad Miller, Nick Hay, and
 # Pieter Abbeel (pabbeel@cs.berkeley.edu).
 
-import torch
 import numpy as np
-from net import PacmanNet
 import os
-from util import manhattanDistance
+from util import manhattanDistance, nearestPoint
 from game import Directions
+from game import Actions
+import ghostAgents
 import random, util
+import math
+import operator
+import time
+import copy
+from collections import OrderedDict
 random.seed(69)  # For reproducibility
-from game import Agent
+from game import Agent, Grid
 from pacman import GameState
+from transpositionTable import TranspositionTable, EXACT, boundFlag
+from parallelSearch import SearchPool, raiseSharedAlpha
+from moveOrdering import MoveOrdering
+from searchStats import SearchStats, TimedEvaluation
+from reachability import getReachability
 
 class ReflexAgent(Agent):
     """
@@ -105,10 +115,175 @@ class MultiAgentSearchAgent(Agent):
     is another abstract class.
     """
 
-    def __init__(self, evalFn = 'scoreEvaluationFunction', depth = '2'):
+    def __init__(self, evalFn = 'scoreEvaluationFunction', depth = '2', ttSize = '0', ttPolicy = 'lru', workers = '0',
+                 ghostRadius = 'none', checkReduction = '0'):
         self.index = 0 # Pacman is always agent index 0
         self.evaluationFunction = util.lookup(evalFn, globals())
         self.depth = int(depth)
+        # Optional transposition table (ttSize > 0), kept for a whole game
+        self.transpositionTable = None
+        if int(ttSize) > 0:
+            self.transpositionTable = TranspositionTable(int(ttSize), ttPolicy)
+        # Optional worker processes for the root moves (workers > 0), kept across games
+        self.workers = int(workers)
+        self.searchPool = None
+        self.gameNumber = 0
+        # Optional ghost move reduction: only ghosts within ghostRadius branch fully
+        self.ghostReduction = None
+        if ghostRadius != 'none':
+            self.ghostReduction = GhostReduction(int(ghostRadius))
+        # With checkReduction=1 every move is searched again at full width, to
+        # count how often ghost move reduction changes the move played
+        self.checkReduction = checkReduction == '1'
+        if self.checkReduction and self.ghostReduction is None:
+            raise Exception('checkReduction=1 needs ghost move reduction (ghostRadius)')
+        self.fullWidthAgent = None
+        self.reductionChecks = 0
+        self.reductionAgreements = 0
+        # Per-move statistics, recorded in moveStats while collectStats is set
+        self.collectStats = False
+        self.stats = None  # SearchStats of the move being searched
+        self.moveStats = []
+
+    def registerInitialState(self, gameState):
+        """
+        Starts every game with an empty transposition table.
+        """
+        self.gameNumber += 1
+        if self.transpositionTable is not None:
+            self.transpositionTable.clear()
+        if self.ghostReduction is not None:
+            self.ghostReduction.clear()
+        if self.fullWidthAgent is not None:
+            self.fullWidthAgent.registerInitialState(gameState)
+        self.reductionChecks = 0
+        self.reductionAgreements = 0
+        self.moveStats = []
+
+    def startMoveStats(self, gameState):
+        """
+        Starts the statistics of the move about to be searched from
+        gameState, if they are collected: the root counts as the one node at
+        ply 0, and successor and evaluation calls are timed until
+        finishMoveStats.  The timer is set through gameState, as pacman.py
+        may be running as __main__ with its own GameState class.
+
+        The worker pool, if any, is forked first: workers copy the agent
+        when they start, and a copy taken later in the move would time its
+        nodes into statistics nobody reads.
+        """
+        if not self.collectStats:
+            return
+        self.getSearchPool()
+        self.stats = SearchStats()
+        self.stats.expand(0)
+        self.evaluationFunction = TimedEvaluation(self.evaluationFunction, self.stats)
+        gameState.setSuccessorTimer(self.stats)
+        table = self.transpositionTable
+        if table is not None:
+            self.tableCounts = (table.probes, table.hits)
+        if self.ghostReduction is not None:
+            self.ghostCounts = self.ghostReduction.counts()
+
+    def finishMoveStats(self, gameState, action, **fields):
+        """
+        Adds the statistics of the move just searched to self.moveStats,
+        with fields added to the record.  With ghost move reduction the
+        record also has the ghost moves searched per ghost node
+        (ghostBranching) and the legal ones (fullGhostBranching).
+        """
+        stats = self.stats
+        if stats is None:
+            return
+        gameState.setSuccessorTimer(None)
+        self.evaluationFunction = self.evaluationFunction.evaluationFunction
+        table = self.transpositionTable
+        if table is not None:
+            probes, hits = self.tableCounts
+            stats.addProbes('transpositionTable', table.probes - probes, table.hits - hits)
+        if self.ghostReduction is not None:
+            fields['ghostBranching'], fields['fullGhostBranching'] = \
+                self.ghostReduction.effectiveBranching(self.ghostCounts)
+        self.moveStats.append(stats.record(agent=type(self).__name__, move=len(self.moveStats),
+                                           action=action, **fields))
+        self.stats = None
+
+    def ghostActions(self, gameState, agentIndex):
+        """
+        The moves searched for a ghost: all its legal actions, or fewer
+        with ghost move reduction.
+        """
+        if self.ghostReduction is not None:
+            return self.ghostReduction.actions(gameState, agentIndex)
+        return gameState.getLegalActions(agentIndex)
+
+    def checkGhostReduction(self, gameState, action):
+        """
+        With checkReduction=1, searches gameState again without ghost move
+        reduction and counts whether that search plays action too.  The
+        full-width choice and its time are added to the move's statistics
+        record as fullWidthAction and fullWidthTime.  The random state is
+        restored afterwards, so the game goes on as it would without the
+        check.
+        """
+        if not self.checkReduction:
+            return
+        if self.fullWidthAgent is None:
+            self.fullWidthAgent = self.fullWidthCopy()
+        randomState = random.getstate()
+        start = time.perf_counter()
+        fullWidthAction = self.fullWidthAgent.getAction(gameState)
+        seconds = time.perf_counter() - start
+        random.setstate(randomState)
+        self.reductionChecks += 1
+        if fullWidthAction == action:
+            self.reductionAgreements += 1
+        if self.collectStats and self.moveStats:
+            self.moveStats[-1]['fullWidthAction'] = fullWidthAction
+            self.moveStats[-1]['fullWidthTime'] = seconds
+
+    def fullWidthCopy(self):
+        """
+        Returns a copy of the agent that searches every ghost move.  It has
+        no transposition table, whose entries would mix values of the two
+        searches, and searches on one core.
+        """
+        agent = copy.copy(self)
+        agent.ghostReduction = None
+        agent.checkReduction = False
+        agent.fullWidthAgent = None
+        agent.transpositionTable = None
+        agent.workers = 0
+        agent.searchPool = None
+        agent.collectStats = False
+        agent.stats = None
+        agent.moveStats = []
+        return agent
+
+    def final(self, gameState):
+        if self.reductionChecks > 0:
+            print('Ghost move reduction: %d of %d moves agree with the full-width search' %
+                  (self.reductionAgreements, self.reductionChecks))
+
+    def getSearchPool(self):
+        """
+        Returns the pool of worker processes, starting it on first use, or
+        None if the agent searches on one core.
+        """
+        if self.searchPool is None and self.workers > 0:
+            self.searchPool = SearchPool(self, self.workers)
+        return self.searchPool
+
+    def prepareWorker(self, gameState, gameNumber):
+        """
+        Readies a worker's copy of the agent to search gameState.  Zobrist
+        keys are drawn lazily, so each process has its own and the state's
+        key is recomputed with this process's keys.
+        """
+        if gameNumber != self.gameNumber:
+            self.registerInitialState(gameState)
+            self.gameNumber = gameNumber
+        gameState.data.zobrist = gameState.data.computeZobrist()
 
 class MinimaxAgent(MultiAgentSearchAgent):
     """
@@ -119,267 +294,1107 @@ class MinimaxAgent(MultiAgentSearchAgent):
         """
         Returns the minimax action using self.depth and self.evaluationFunction.
         """
-        
-        def minimax(agentIndex, depth, gameState):
-            """
-            Recursive minimax function
-            
-            Args:
-            - agentIndex: Current agent (0=Pacman, 1+=Ghosts)  
-            - depth: Current depth in the game tree
-            - gameState: Current state of the game
-            
-            Returns:
-            - Best evaluation score for this state
-            """
-            # Base case: terminal state or maximum depth reached
-            if gameState.isWin() or gameState.isLose() or depth == self.depth:
-                return self.evaluationFunction(gameState)
-
-            # Pacman's turn (Maximizer)
-            if agentIndex == 0:
-                return maxValue(agentIndex, depth, gameState)
-            # Ghost's turn (Minimizer)  
-            else:
-                return minValue(agentIndex, depth, gameState)
-        
-        def maxValue(agentIndex, depth, gameState):
-            """
-            Handles Pacman's moves (maximizing player)
-            """
-            v = float('-inf')  # Start with worst possible value
-            legalActions = gameState.getLegalActions(agentIndex)
-            
-            # No legal actions available
-            if not legalActions:
-                return self.evaluationFunction(gameState)
-
-            # Try each possible action and choose the best
-            for action in legalActions:
-                successor = gameState.generateSuccessor(agentIndex, action)
-                # After Pacman moves, first ghost plays (agent 1)
-                v = max(v, minimax(1, depth, successor))
-            return v
-
-        def minValue(agentIndex, depth, gameState):
-            """
-            Handles Ghost moves (minimizing players)
-            """
-            v = float('inf')  # Start with best possible value for Pacman
-            legalActions = gameState.getLegalActions(agentIndex)
-            
-            # No legal actions available
-            if not legalActions:
-                return self.evaluationFunction(gameState)
-
-            # Determine next agent and depth
-            nextAgent = agentIndex + 1
-            nextDepth = depth
-            
-            # If all ghosts have moved, return to Pacman and increment depth
-            if nextAgent == gameState.getNumAgents():
-                nextAgent = 0      # Back to Pacman
-                nextDepth = depth + 1  # New ply begins
-
-            # Try each possible action and choose the worst for Pacman
-            for action in legalActions:
-                successor = gameState.generateSuccessor(agentIndex, action)
-                v = min(v, minimax(nextAgent, nextDepth, successor))
-            return v
+        self.startMoveStats(gameState)
+        legalActions = gameState.getLegalActions(0)
+
+        # Each of Pacman's moves can be searched in its own worker
+        pool = self.getSearchPool()
+        if pool is not None and len(legalActions) > 1:
+            scores = pool.map('searchRootMoveInWorker',
+                              [(gameState, action, self.gameNumber) for action in legalActions])
+        else:
+            scores = [self.searchRootMove(gameState, action) for action in legalActions]
 
         # Main decision logic for Pacman
         bestAction = None
         bestScore = float('-inf')
 
         # Try each legal action for Pacman
-        for action in gameState.getLegalActions(0):
-            successor = gameState.generateSuccessor(0, action)
-            # Start minimax with first ghost (agent 1) at current depth
-            score = minimax(1, 0, successor)
-            
+        for action, score in zip(legalActions, scores):
             if score > bestScore:
                 bestScore = score
                 bestAction = action
 
+        self.finishMoveStats(gameState, bestAction, depth=self.depth)
+        self.checkGhostReduction(gameState, bestAction)
         return bestAction
-    
-class AlphaBetaAgent(MultiAgentSearchAgent):
-    """
-    Minimax agent with alpha-beta pruning
-    """
 
-    def getAction(self, gameState: GameState):
+    def searchRootMove(self, gameState, action):
+        successor = gameState.generateSuccessor(0, action)
+        # Start minimax with first ghost (agent 1) at current depth
+        return self.minimax(1, 0, successor)
+
+    def searchRootMoveInWorker(self, gameState, action, gameNumber):
+        self.prepareWorker(gameState, gameNumber)
+        return self.searchRootMove(gameState, action)
+
+    def minimax(self, agentIndex, depth, gameState):
         """
-        Returns the alpha-beta action using self.depth and self.evaluationFunction
+        Recursive minimax function
+
+        Args:
+        - agentIndex: Current agent (0=Pacman, 1+=Ghosts)  
+        - depth: Current depth in the game tree
+        - gameState: Current state of the game
+
+        Returns:
+        - Best evaluation score for this state
         """
-        
-        def alphabeta(agentIndex, depth, gameState, alpha, beta):
-            # Base case: Check if the game is over or if we've reached the maximum depth
-            if gameState.isWin() or gameState.isLose() or depth == self.depth:
-                return self.evaluationFunction(gameState)
-
-            # Pacman (maximizer) is agentIndex 0
-            if agentIndex == 0:
-                return maxValue(agentIndex, depth, gameState, alpha, beta)
-            # Ghosts (minimizer) are agentIndex 1 or higher
-            else:
-                return minValue(agentIndex, depth, gameState, alpha, beta)
+        if self.stats is not None:
+            self.stats.expand(depth * gameState.getNumAgents() + agentIndex)
+
+        # Base case: terminal state or maximum depth reached
+        if gameState.isWin() or gameState.isLose() or depth == self.depth:
+            return self.evaluationFunction(gameState)
+
+        # Reuse the value of a position already reached by another path
+        table = self.transpositionTable
+        if table is not None:
+            key = gameState.getZobristKey()
+            entry = table.lookup(key, agentIndex, self.depth - depth)
+            if entry is not None:
+                return entry[0]
+
+        # Pacman's turn (Maximizer)
+        if agentIndex == 0:
+            v = self.maxValue(agentIndex, depth, gameState)
+        # Ghost's turn (Minimizer)  
+        else:
+            v = self.minValue(agentIndex, depth, gameState)
+
+        if table is not None:
+            table.store(key, agentIndex, self.depth - depth, v, EXACT)
+        return v
+
+    def maxValue(self, agentIndex, depth, gameState):
+        """
+        Handles Pacman's moves (maximizing player)
+        """
+        v = float('-inf')  # Start with worst possible value
+        legalActions = gameState.getLegalActions(agentIndex)
 
-        def maxValue(agentIndex, depth, gameState, alpha, beta):
-            # Initialize max value
-            v = float('-inf')
-            # Get Pacman's legal actions
-            legalActions = gameState.getLegalActions(agentIndex)
+        # No legal actions available
+        if not legalActions:
+            return self.evaluationFunction(gameState)
 
-            if not legalActions:
-                return self.evaluationFunction(gameState)
+        # Try each possible action and choose the best
+        for action in legalActions:
+            successor = gameState.generateSuccessor(agentIndex, action)
+            # After Pacman moves, first ghost plays (agent 1)
+            v = max(v, self.minimax(1, depth, successor))
+        return v
 
-            # Iterate through all possible actions and update alpha-beta values
-            for action in legalActions:
-                successor = gameState.generateSuccessor(agentIndex, action)
-                v = max(v, alphabeta(1, depth, successor, alpha, beta))  # Ghosts start at index 1
-                if v > beta:
-                    return v  # Prune the remaining branches
-                alpha = max(alpha, v)
-            return v
+    def minValue(self, agentIndex, depth, gameState):
+        """
+        Handles Ghost moves (minimizing players)
+        """
+        v = float('inf')  # Start with best possible value for Pacman
+        legalActions = self.ghostActions(gameState, agentIndex)
 
-        def minValue(agentIndex, depth, gameState, alpha, beta):
-            # Initialize min value
-            v = float('inf')
-            # Get the current agent's legal actions (ghosts)
-            legalActions = gameState.getLegalActions(agentIndex)
+        # No legal actions available
+        if not legalActions:
+            return self.evaluationFunction(gameState)
 
-            if not legalActions:
-                return self.evaluationFunction(gameState)
+        # Determine next agent and depth
+        nextAgent = agentIndex + 1
+        nextDepth = depth
 
-            # Get the next agent's index and check if we need to increase depth
-            nextAgent = agentIndex + 1
-            if nextAgent == gameState.getNumAgents():
-                nextAgent = 0  # Go back to Pacman
-                depth += 1  # Increase the depth since we've gone through all agents
+        # If all ghosts have moved, return to Pacman and increment depth
+        if nextAgent == gameState.getNumAgents():
+            nextAgent = 0      # Back to Pacman
+            nextDepth = depth + 1  # New ply begins
 
-            # Iterate through all possible actions and update alpha-beta values
-            for action in legalActions:
-                successor = gameState.generateSuccessor(agentIndex, action)
-                v = min(v, alphabeta(nextAgent, depth, successor, alpha, beta))
-                if v < alpha:
-                    return v  # Prune the remaining branches
-                beta = min(beta, v)
-            return v
+        # Try each possible action and choose the worst for Pacman
+        for action in legalActions:
+            successor = gameState.generateSuccessor(agentIndex, action)
+            v = min(v, self.minimax(nextAgent, nextDepth, successor))
+        return v
+
+class SearchTimeout(Exception):
+    """
+    Raised inside a search when the time allowed for the move has run out.
+    """
+    pass
+
+class AlphaBetaAgent(MultiAgentSearchAgent):
+    """
+    Minimax agent with alpha-beta pruning
+
+    With timeLimit > 0 (seconds per move) the agent deepens iteratively:
+    it searches to depth 1, 2, 3... until the time is spent and plays the
+    move of the deepest search that finished.  Each iteration tries the
+    principal variation of the previous one first.
+
+    With reuse=1 the search starts warm from the previous turn's: the best
+    line found below every position Pacman could face after one round
+    (his move and every ghost's reply) is kept, and if the ghosts' actual
+    replies led to one of them it becomes the first principal variation
+    of the new search.  Killer moves are shifted up one round instead of
+    being dropped.  The transposition table, if any, is kept all game
+    either way.
+    """
 
-        # Pacman (agentIndex 0) will choose the action with the best alpha-beta score
+    def __init__(self, evalFn = 'scoreEvaluationFunction', depth = '2', ttSize = '0', ttPolicy = 'lru', timeLimit = '0', workers = '0', ordering = 'none',
+                 ghostRadius = 'none', reuse = '0', checkReduction = '0'):
+        MultiAgentSearchAgent.__init__(self, evalFn, depth, ttSize, ttPolicy, workers, ghostRadius, checkReduction)
+        self.timeLimit = float(timeLimit)
+        self.searchDepth = self.depth  # Depth of the search in progress
+        self.completedDepth = 0        # Deepest search finished for the last move
+        self.deadline = None
+        self.searchCutoff = False      # Whether the last search stopped a line at the depth limit
+        self.principalVariation = []
+        # Optional move ordering heuristics below the root, e.g. ordering=killer+history
+        self.moveOrdering = None
+        if ordering != 'none':
+            self.moveOrdering = MoveOrdering(ordering.split('+'))
+        self.nodeCount = 0   # Nodes searched for the last move
+        self.totalNodes = 0  # Nodes searched this game, reported by final()
+        self.movesSearched = 0
+        self.reuse = reuse == '1'
+        self.replyLines = {}  # Zobrist key -> best line, one round below the last root
+        self.startingLine = []
+
+    def registerInitialState(self, gameState):
+        MultiAgentSearchAgent.registerInitialState(self, gameState)
+        self.totalNodes = 0
+        self.movesSearched = 0
+        self.replyLines = {}
+        if self.moveOrdering is not None:
+            self.moveOrdering.clear()
+
+    def getAction(self, gameState: GameState):
+        """
+        Returns the alpha-beta action using self.depth and self.evaluationFunction,
+        or iterative deepening when a time limit is set
+        """
+        self.nodeCount = 0
+        self.startMoveStats(gameState)
+        self.startingLine = []
+        if self.reuse:
+            self.startingLine = self.replyLines.get(gameState.getZobristKey(), [])
+            self.replyLines = {}
+            if self.stats is not None:
+                self.stats.probe('replyLines', len(self.startingLine) > 0)
+        if self.moveOrdering is not None:
+            self.moveOrdering.newSearch(gameState.getNumAgents() if self.reuse else 0)
+        action = self.search(gameState)
+        self.totalNodes += self.nodeCount
+        self.movesSearched += 1
+        self.finishMoveStats(gameState, action, depth=self.completedDepth)
+        self.checkGhostReduction(gameState, action)
+        return action
+
+    def final(self, gameState):
+        """
+        Prints the nodes searched this game, below the root, to compare move
+        orderings and other settings; per-move counts are in the search
+        statistics (nodes, which also counts the root).
+        """
+        MultiAgentSearchAgent.final(self, gameState)
+        if self.movesSearched > 0:
+            print('%s searched %d nodes in %d moves (%.1f per move)' %
+                  (type(self).__name__, self.totalNodes, self.movesSearched,
+                   self.totalNodes / float(self.movesSearched)))
+
+    def fullWidthCopy(self):
+        agent = MultiAgentSearchAgent.fullWidthCopy(self)
+        # Its own killer moves and history, so it does not reorder this agent's search
+        agent.moveOrdering = copy.deepcopy(self.moveOrdering)
+        return agent
+
+    def search(self, gameState):
+        """
+        Searches to self.depth, or deepens iteratively if a time limit is set.
+        """
+        if self.timeLimit > 0:
+            return self.iterativeDeepening(gameState)
+
+        self.searchDepth = self.depth
+        self.deadline = None
+        self.searchCutoff = False
+        self.principalVariation = self.startingLine
+        action = self.searchRoot(gameState)
+        self.completedDepth = self.depth
+        return action
+
+    def iterativeDeepening(self, gameState):
+        """
+        Searches ever deeper until self.timeLimit seconds have passed and
+        returns the action of the last search that finished.
+        """
+        deadline = time.time() + self.timeLimit
+        self.principalVariation = self.startingLine
         bestAction = None
-        bestScore = float('-inf')
-        alpha = float('-inf')
-        beta = float('inf')
+        depth = 1
+        while True:
+            self.searchDepth = depth
+            # The depth 1 search always finishes, so there is a move to play
+            self.deadline = deadline if depth > 1 else None
+            self.searchCutoff = False
+            try:
+                action = self.searchRoot(gameState)
+            except SearchTimeout:
+                break
+            bestAction = action
+            self.completedDepth = depth
+            # Stop early once every line ends the game before the depth limit
+            if not self.searchCutoff or time.time() >= deadline:
+                break
+            depth += 1
+        self.deadline = None
+        return bestAction
 
-        for action in gameState.getLegalActions(0):  # Pacman's legal actions
-            successor = gameState.generateSuccessor(0, action)
-            score = alphabeta(1, 0, successor, alpha, beta)  # Start with Ghost 1, depth 0
+    def searchRoot(self, gameState):
+        """
+        Searches gameState to self.searchDepth, records the principal
+        variation and returns the best action for Pacman.
+        """
+        self.numAgents = gameState.getNumAgents()
+        self.pvLines = {}
+        self.followPV = len(self.principalVariation) > 0
+        rootActions = gameState.getLegalActions(0)  # Pacman's legal actions
+        legalActions = self.orderActions(gameState, 0, rootActions, 0)
+        self.followPV = False
+
+        pool = self.getSearchPool()
+        if pool is not None and len(legalActions) > 1:
+            results = self.searchRootParallel(gameState, legalActions, pool)
+        else:
+            results = []
+            alpha = float('-inf')
+            for action in legalActions:
+                score, line = self.searchRootMove(gameState, action, alpha)
+                results.append((score, line))
+                alpha = max(alpha, score)
+
+        # Pacman (agentIndex 0) will choose the action with the best alpha-beta score.
+        # Pruning is strict, so a move tying the best score really ties it; ties
+        # go to the first move in getLegalActions order, wherever the principal
+        # variation put it in the search.
+        bestAction = None
+        bestLine = []
+        bestScore = float('-inf')
+        searched = sorted(zip(legalActions, results), key=lambda result: rootActions.index(result[0]))
+        for action, (score, line) in searched:
             if score > bestScore:
                 bestScore = score
                 bestAction = action
-            alpha = max(alpha, score)
+                bestLine = line
 
+        self.principalVariation = bestLine
         return bestAction
 
-class HybridAgent(Agent):
+    def searchRootMove(self, gameState, action, alpha):
+        """
+        Searches Pacman's move action with the window [alpha, inf] and
+        returns its score and principal variation.
+        """
+        pv = self.principalVariation
+        self.followPV = len(pv) > 0 and pv[0] == action
+        successor = gameState.generateSuccessor(0, action)
+        score = self.alphabeta(1, 0, successor, alpha, float('inf'))  # Start with Ghost 1, depth 0
+        self.followPV = False
+        return score, [action] + self.pvLines[1]
+
+    def searchRootParallel(self, gameState, legalActions, pool):
+        """
+        Young brothers wait: searches the first move here to get a bound,
+        then the other moves in the worker pool, where each prunes against
+        the best score found so far by any worker.  Returns the same
+        scores, for deciding the move, as searching them one by one.
+        """
+        first = self.searchRootMove(gameState, legalActions[0], float('-inf'))
+        pool.setAlpha(first[0])
+        tasks = [(gameState, action, self.searchDepth, self.deadline, self.principalVariation, self.gameNumber)
+                 for action in legalActions[1:]]
+        results = pool.map('searchRootMoveInWorker', tasks)
+        if None in results:
+            raise SearchTimeout()
+        for score, line, cutoff, nodes in results:
+            self.searchCutoff = self.searchCutoff or cutoff
+            self.nodeCount += nodes
+            if self.stats is not None:
+                self.stats.extraNodes += nodes
+                self.stats.workerPlies = max(self.stats.workerPlies, self.searchDepth * self.numAgents)
+        return [first] + [(score, line) for score, line, cutoff, nodes in results]
+
+    def searchRootMoveInWorker(self, gameState, action, searchDepth, deadline, principalVariation, gameNumber):
+        """
+        Runs in a worker process: searches one root move against the shared
+        alpha and returns (score, principal variation, cutoff, nodes searched),
+        or None if the deadline passed.
+        """
+        self.prepareWorker(gameState, gameNumber)
+        self.searchDepth = searchDepth
+        self.deadline = deadline
+        self.principalVariation = principalVariation
+        self.numAgents = gameState.getNumAgents()
+        self.pvLines = {}
+        self.searchCutoff = False
+        self.nodeCount = 0
+        if self.moveOrdering is not None:
+            self.moveOrdering.killers = {}
+        try:
+            score, line = self.searchRootMove(gameState, action, self.sharedAlpha.value)
+        except SearchTimeout:
+            return None
+        raiseSharedAlpha(self.sharedAlpha, score)
+        return score, line, self.searchCutoff, self.nodeCount
+
+    def orderActions(self, gameState, agentIndex, legalActions, ply):
+        """
+        Sorts the actions below the root with self.moveOrdering, then moves
+        the previous iteration's principal variation move to the front
+        while the search is still following that line.  At the root only the
+        principal variation move is moved; searchRoot breaks ties between
+        root moves in getLegalActions order, as without it.
+        """
+        if self.moveOrdering is not None and ply > 0:
+            legalActions = self.moveOrdering.order(gameState, agentIndex, ply, legalActions)
+        if self.followPV:
+            pv = self.principalVariation
+            if ply < len(pv) and pv[ply] in legalActions:
+                return [pv[ply]] + [action for action in legalActions if action != pv[ply]]
+            self.followPV = False
+        return legalActions
+
+    def alphabeta(self, agentIndex, depth, gameState, alpha, beta):
+        # Every agent's move is one ply; the line found below this node goes in pvLines[ply]
+        ply = depth * self.numAgents + agentIndex
+        self.pvLines[ply] = []
+        self.nodeCount += 1
+        if self.stats is not None:
+            self.stats.expand(ply)
+
+        # Base case: Check if the game is over or if we've reached the maximum depth
+        if gameState.isWin() or gameState.isLose():
+            return self.evaluationFunction(gameState)
+        if depth == self.searchDepth:
+            self.searchCutoff = True
+            return self.evaluationFunction(gameState)
+
+        if self.deadline is not None and time.time() > self.deadline:
+            raise SearchTimeout()
+
+        # Reuse a stored value or bound that settles this window
+        table = self.transpositionTable
+        if table is not None:
+            key = gameState.getZobristKey()
+            stored = table.probe(key, agentIndex, self.searchDepth - depth, alpha, beta)
+            if stored is not None:
+                self.searchCutoff = True
+                return stored
+
+        # Pacman (maximizer) is agentIndex 0
+        if agentIndex == 0:
+            v = self.maxValue(agentIndex, depth, gameState, alpha, beta)
+        # Ghosts (minimizer) are agentIndex 1 or higher
+        else:
+            v = self.minValue(agentIndex, depth, gameState, alpha, beta)
+
+        if table is not None:
+            table.store(key, agentIndex, self.searchDepth - depth, v, boundFlag(v, alpha, beta))
+        return v
+
+    def maxValue(self, agentIndex, depth, gameState, alpha, beta):
+        # Initialize max value
+        v = float('-inf')
+        # Get Pacman's legal actions
+        legalActions = gameState.getLegalActions(agentIndex)
+
+        if not legalActions:
+            return self.evaluationFunction(gameState)
+
+        # Iterate through all possible actions and update alpha-beta values
+        ply = depth * self.numAgents + agentIndex
+        for action in self.orderActions(gameState, agentIndex, legalActions, ply):
+            successor = gameState.generateSuccessor(agentIndex, action)
+            value = self.alphabeta(1, depth, successor, alpha, beta)  # Ghosts start at index 1
+            self.followPV = False
+            if value > v:
+                v = value
+                self.pvLines[ply] = [action] + self.pvLines[ply + 1]
+            if v > beta:
+                if self.stats is not None:
+                    self.stats.cutoff()
+                if self.moveOrdering is not None:
+                    self.moveOrdering.recordCutoff(gameState, agentIndex, ply, action, self.searchDepth - depth)
+                break  # Prune the remaining branches
+            alpha = max(alpha, v)
+
+        # Positions one round below the root are where the next search may start
+        if self.reuse and ply == self.numAgents:
+            self.replyLines[gameState.getZobristKey()] = self.pvLines[ply]
+        return v
+
+    def minValue(self, agentIndex, depth, gameState, alpha, beta):
+        # Initialize min value
+        v = float('inf')
+        # Get the current agent's legal actions (ghosts)
+        legalActions = self.ghostActions(gameState, agentIndex)
+
+        if not legalActions:
+            return self.evaluationFunction(gameState)
+
+        # Get the next agent's index and check if we need to increase depth
+        ply = depth * self.numAgents + agentIndex
+        remainingDepth = self.searchDepth - depth
+        nextAgent = agentIndex + 1
+        if nextAgent == self.numAgents:
+            nextAgent = 0  # Go back to Pacman
+            depth += 1  # Increase the depth since we've gone through all agents
+
+        # Iterate through all possible actions and update alpha-beta values
+        for action in self.orderActions(gameState, agentIndex, legalActions, ply):
+            successor = gameState.generateSuccessor(agentIndex, action)
+            value = self.alphabeta(nextAgent, depth, successor, alpha, beta)
+            self.followPV = False
+            if value < v:
+                v = value
+                self.pvLines[ply] = [action] + self.pvLines[ply + 1]
+            if v < alpha:
+                if self.stats is not None:
+                    self.stats.cutoff()
+                if self.moveOrdering is not None:
+                    self.moveOrdering.recordCutoff(gameState, agentIndex, ply, action, remainingDepth)
+                return v  # Prune the remaining branches
+            beta = min(beta, v)
+        return v
+
+class HybridAgent(AlphaBetaAgent):
     """
     Un agente que usa Minimax con poda alfa-beta, evaluando los estados
     con una red neuronal entrenada a partir de partidas previas del jugador.
+    Con timeLimit > 0 profundiza iterativamente hasta agotar el tiempo.
+
+    Con batchSize > 0 busca en dos fases: expande el árbol entero y luego
+    evalúa sus hojas por lotes de batchSize estados, con una pasada de la
+    red por lote en lugar de una por hoja.  Sin poda se visitan más nodos
+    (a profundidad 4 en mediumClassic, 2170 en lugar de unos 700), a cambio de
+    muchas menos pasadas de la red.  Este modo no usa workers, ttSize,
+    ordering ni reuse, así que no se pueden combinar con él.
+
+    Las estadísticas de búsqueda guardan las pasadas de la red de cada
+    jugada (forwardPasses), y al final de cada partida se imprime el total.
+
+    Con backend=numpy la red se evalúa con NumPy en lugar de torch.
     """
 
-    def __init__(self, depth=5):
-        self.neural_agent = NeuralAgent("models/pacman_model.pth")  # Se le pasa una instancia de NeuralAgent
+    def __init__(self, depth=5, timeLimit='0', ttSize='0', ttPolicy='lru', workers='0', batchSize='0', ordering='none',
+                 ghostRadius='none', reuse='0', backend='torch', cacheSize='100000', checkReduction='0'):
+        AlphaBetaAgent.__init__(self, depth=depth, ttSize=ttSize, ttPolicy=ttPolicy, timeLimit=timeLimit,
+                                workers=workers, ordering=ordering, ghostRadius=ghostRadius, reuse=reuse,
+                                checkReduction=checkReduction)
+        self.neural_agent = NeuralAgent("models/pacman_model.pth", backend, cacheSize)  # Se le pasa una instancia de NeuralAgent
         self.evaluationFunction = self.neural_agent.evaluationFunction
-        self.depth = depth
+        self.batchSize = int(batchSize)
+        if self.batchSize > 0:
+            ignored = [name for name, used in [('workers', self.workers > 0),
+                                               ('ttSize', self.transpositionTable is not None),
+                                               ('ordering', self.moveOrdering is not None),
+                                               ('reuse', self.reuse)] if used]
+            if ignored:
+                raise Exception('batchSize > 0 busca sin poda y no usa %s' % ', '.join(ignored))
+        self.game_passes = 0  # Pasadas de la red al empezar la partida
+
+    def registerInitialState(self, gameState):
+        AlphaBetaAgent.registerInitialState(self, gameState)
+        self.neural_agent.registerInitialState(gameState)
+        self.game_passes = self.neural_agent.forward_passes
+
+    def final(self, gameState):
+        AlphaBetaAgent.final(self, gameState)
+        print('%s: %d pasadas de la red en la partida' %
+              (type(self).__name__, self.neural_agent.forward_passes - self.game_passes))
+
+    def startMoveStats(self, gameState):
+        AlphaBetaAgent.startMoveStats(self, gameState)
+        self.cache_counts = (self.neural_agent.cache_hits, self.neural_agent.cache_misses)
+        self.move_passes = self.neural_agent.forward_passes
+
+    def finishMoveStats(self, gameState, action, **fields):
+        if self.stats is not None:
+            hits = self.neural_agent.cache_hits - self.cache_counts[0]
+            misses = self.neural_agent.cache_misses - self.cache_counts[1]
+            self.stats.addProbes('evaluationCache', hits + misses, hits)
+            fields['forwardPasses'] = self.neural_agent.forward_passes - self.move_passes
+        AlphaBetaAgent.finishMoveStats(self, gameState, action, **fields)
+
+    def searchRoot(self, gameState):
+        if self.batchSize > 0:
+            return self.searchRootBatched(gameState)
+        return AlphaBetaAgent.searchRoot(self, gameState)
+
+    def searchRootBatched(self, gameState):
+        """
+        Fase 1: expande el árbol hasta self.searchDepth, juntando las
+        posiciones repetidas, y guarda cada hoja distinta una sola vez.
+        Fase 2: evalúa todas las hojas por lotes.
+        Fase 3: propaga los valores minimax hasta la raíz.
 
-    def getAction(self, gameState: GameState):
-        def alphabeta(agentIndex, depth, gameState, alpha, beta):
-            if gameState.isWin() or gameState.isLose() or depth == self.depth:
-                return self.evaluationFunction(gameState)
+        Sin poda, el valor de cada acción es el minimax exacto, el mismo
+        que da alfa-beta, así que se elige la misma acción.
+        """
+        self.numAgents = gameState.getNumAgents()
+        self.leafStates = []
+        self.leafIndex = {}
+        self.expanded = {}
 
-            if agentIndex == 0:  # Pacman (maximiza)
-                return maxValue(agentIndex, depth, gameState, alpha, beta)
-            else:  # Fantasmas (minimizan)
-                return minValue(agentIndex, depth, gameState, alpha, beta)
+        children = []
+        for action in gameState.getLegalActions(0):
+            successor = gameState.generateSuccessor(0, action)
+            children.append((action, self.expand(1, 0, successor)))
+
+        # El plazo se comprueba entre lotes, así que puede pasarse en uno
+        values = []
+        for start in range(0, len(self.leafStates), self.batchSize):
+            if self.deadline is not None and time.time() > self.deadline:
+                raise SearchTimeout()
+            batch = self.leafStates[start:start + self.batchSize]
+            batchStart = time.perf_counter()
+            values.extend(self.neural_agent.evaluate_batch(batch, self.batchSize))
+            if self.stats is not None:
+                self.stats.recordEvaluations(len(batch), time.perf_counter() - batchStart)
 
-        def maxValue(agentIndex, depth, gameState, alpha, beta):
-            v = float('-inf')
-            legalActions = gameState.getLegalActions(agentIndex)
-            if not legalActions:
-                return self.evaluationFunction(gameState)
+        bestAction = None
+        bestScore = float('-inf')
+        backedUp = {}
+        for action, node in children:
+            score = self.backUp(node, values, backedUp)
+            if score > bestScore:
+                bestScore = score
+                bestAction = action
 
-            for action in legalActions:
-                successor = gameState.generateSuccessor(agentIndex, action)
-                v = max(v, alphabeta(1, depth, successor, alpha, beta))
-                if v > beta:
-                    return v
-                alpha = max(alpha, v)
-            return v
+        self.principalVariation = [bestAction] if bestAction is not None else []
+        self.leafStates = self.leafIndex = self.expanded = None
+        return bestAction
 
-        def minValue(agentIndex, depth, gameState, alpha, beta):
-            v = float('inf')
-            legalActions = gameState.getLegalActions(agentIndex)
-            if not legalActions:
-                return self.evaluationFunction(gameState)
+    def expand(self, agentIndex, depth, gameState):
+        """
+        Devuelve el nodo de gameState: el índice de su hoja en
+        self.leafStates, o (esMax, hijos) si hay que seguir bajando.
+        """
+        key = (gameState.getZobristKey(), agentIndex, depth)
+        node = self.expanded.get(key)
+        if self.stats is not None:
+            self.stats.probe('expanded', node is not None)
+        if node is not None:
+            return node
+
+        self.nodeCount += 1
+        if self.stats is not None:
+            self.stats.expand(depth * self.numAgents + agentIndex)
+        if self.deadline is not None and time.time() > self.deadline:
+            raise SearchTimeout()
+
+        legalActions = None
+        if not (gameState.isWin() or gameState.isLose()):
+            if depth == self.searchDepth:
+                self.searchCutoff = True
+            elif agentIndex == 0:
+                legalActions = gameState.getLegalActions(agentIndex)
+            else:
+                legalActions = self.ghostActions(gameState, agentIndex)
 
+        if not legalActions:
+            node = self.leafFor(gameState)
+        else:
             nextAgent = agentIndex + 1
-            if nextAgent == gameState.getNumAgents():
+            nextDepth = depth
+            if nextAgent == self.numAgents:
                 nextAgent = 0
-                depth += 1
+                nextDepth += 1
+            node = (agentIndex == 0,
+                    [self.expand(nextAgent, nextDepth, gameState.generateSuccessor(agentIndex, action))
+                     for action in legalActions])
+        self.expanded[key] = node
+        return node
+
+    def leafFor(self, gameState):
+        key = gameState.getZobristKey()
+        index = self.leafIndex.get(key)
+        if self.stats is not None:
+            self.stats.probe('leaves', index is not None)
+        if index is None:
+            index = self.leafIndex[key] = len(self.leafStates)
+            self.leafStates.append(gameState)
+        return index
+
+    def backUp(self, node, values, backedUp):
+        if isinstance(node, int):
+            return values[node]
+        v = backedUp.get(id(node))
+        if v is None:
+            isMax, children = node
+            childValues = [self.backUp(child, values, backedUp) for child in children]
+            v = max(childValues) if isMax else min(childValues)
+            backedUp[id(node)] = v
+        return v
+
+class GhostModel:
+    """
+    Predicts ghosts in search with the move distribution of a ghost agent
+    class from ghostAgents.
 
-            for action in legalActions:
-                successor = gameState.generateSuccessor(agentIndex, action)
-                v = min(v, alphabeta(nextAgent, depth, successor, alpha, beta))
-                if v < alpha:
-                    return v
-                beta = min(beta, v)
-            return v
+    The ghostAgents distributions only depend on the ghost's position,
+    heading and whether it is scared, and on Pacman's position, so they are
+    cached on those until clear() is called.
+    """
+
+    def __init__(self, ghostType = 'DirectionalGhost'):
+        self.ghostType = getattr(ghostAgents, ghostType)
+        self.ghosts = {}  # agentIndex -> ghost agent used as model
+        self.clear()
+
+    def clear(self):
+        self.cache = {}
 
+    def distribution(self, gameState, agentIndex):
+        """
+        Returns the ghost's moves and their probabilities, as two lists.
+        """
+        ghostState = gameState.getGhostState(agentIndex)
+        configuration = ghostState.configuration
+        key = (configuration.pos, configuration.direction, ghostState.scaredTimer > 0,
+               gameState.getPacmanPosition())
+        entry = self.cache.get(key)
+        if entry is None:
+            ghost = self.ghosts.get(agentIndex)
+            if ghost is None:
+                ghost = self.ghosts[agentIndex] = self.ghostType(agentIndex)
+            dist = ghost.getDistribution(gameState)
+            entry = (list(dist.keys()), list(dist.values()))
+            self.cache[key] = entry
+        return entry
+
+    def sample(self, gameState, agentIndex, rng):
+        """
+        Draws a move for the ghost using the random.Random rng.
+        """
+        actions, probabilities = self.distribution(gameState, agentIndex)
+        r = rng.random()
+        for action, probability in zip(actions, probabilities):
+            r -= probability
+            if r < 0:
+                return action
+        return actions[-1]
+
+class GhostReduction:
+    """
+    Cuts down the ghost moves searched by the minimax agents.  With four
+    ghosts every round multiplies the tree by the product of their moves,
+    but a ghost far from Pacman rarely changes the best move.  So a ghost
+    whose maze distance to Pacman is more than radius only plays its
+    predicted move, the one DirectionalGhost would most likely choose, and
+    a ghost that started the round on the same cell as an earlier ghost,
+    with the same scared state, makes that ghost's move.  Every other ghost
+    branches fully.
+
+    Whether a ghost is reduced only depends on the state it moves from, so
+    transposition table entries stay consistent.  The counters say how much
+    was cut: fullMoves legal moves at searched ghost nodes against
+    searchedMoves actually searched.  Search statistics record them per
+    move, and checkReduction=1 compares the moves played with those of a
+    full-width search.
+    """
+
+    def __init__(self, radius):
+        self.radius = radius
+        self.ghostModel = GhostModel('DirectionalGhost')
+        self.clear()
+
+    def clear(self):
+        self.ghostModel.clear()
+        self.ghostNodes = 0
+        self.fullMoves = 0
+        self.searchedMoves = 0
+
+    def actions(self, gameState, agentIndex):
+        """
+        Returns the moves to search for the ghost at agentIndex.
+        """
+        legalActions = gameState.getLegalActions(agentIndex)
+        actions = legalActions
+        if len(legalActions) > 1:
+            actions = self.mergedAction(gameState, agentIndex, legalActions)
+            if actions is None and not self.isThreat(gameState, agentIndex):
+                actions = [self.predictedAction(gameState, agentIndex)]
+            if actions is None:
+                actions = legalActions
+        self.ghostNodes += 1
+        self.fullMoves += len(legalActions)
+        self.searchedMoves += len(actions)
+        return actions
+
+    def isThreat(self, gameState, agentIndex):
+        pacmanPosition = gameState.getPacmanPosition()
+        ghostCell = nearestPoint(gameState.getGhostPosition(agentIndex))
+        oracle = gameState.data.layout.getDistanceOracle()
+        return oracle.dist(pacmanPosition, ghostCell) <= self.radius
+
+    def predictedAction(self, gameState, agentIndex):
+        actions, probabilities = self.ghostModel.distribution(gameState, agentIndex)
+        return actions[probabilities.index(max(probabilities))]
+
+    def mergedAction(self, gameState, agentIndex, legalActions):
+        """
+        Returns [action] if an earlier ghost moved this round from the cell
+        this ghost is on, with action the move it made, or None.  Earlier
+        ghosts have already moved, so their start cell is worked out from
+        their heading; a ghost whose scared timer just ran out is not
+        recognised, and is searched on its own.
+        """
+        agentStates = gameState.data.agentStates
+        ghostState = agentStates[agentIndex]
+        position = ghostState.configuration.pos
+        scared = ghostState.scaredTimer > 0
+        for other in range(1, agentIndex):
+            otherState = agentStates[other]
+            direction = otherState.configuration.direction
+            if direction == Directions.STOP or (otherState.scaredTimer > 0) != scared:
+                continue
+            dx, dy = Actions.directionToVector(direction, 0.5 if scared else 1.0)
+            x, y = otherState.configuration.pos
+            if (x - dx, y - dy) == position and direction in legalActions:
+                return [direction]
+        return None
+
+    def counts(self):
+        return self.ghostNodes, self.fullMoves, self.searchedMoves
+
+    def effectiveBranching(self, since=(0, 0, 0)):
+        """
+        Average ghost moves searched per ghost node, and without reduction,
+        counting the nodes since counts() returned since.
+        """
+        ghostNodes = self.ghostNodes - since[0]
+        if ghostNodes == 0:
+            return 0.0, 0.0
+        return ((self.searchedMoves - since[2]) / float(ghostNodes),
+                (self.fullMoves - since[1]) / float(ghostNodes))
+
+class ExpectimaxAgent(MultiAgentSearchAgent):
+    """
+    Expectimax agent whose chance nodes follow the move distribution of a
+    ghost agent from ghostAgents (ghostModel, DirectionalGhost by default)
+    """
+
+    def __init__(self, evalFn = 'scoreEvaluationFunction', depth = '2', ghostModel = 'DirectionalGhost'):
+        MultiAgentSearchAgent.__init__(self, evalFn, depth)
+        self.ghostModel = GhostModel(ghostModel)  # cache kept for the whole game
+        self.chanceValues = {}                    # kept for one move
+
+    def registerInitialState(self, gameState):
+        MultiAgentSearchAgent.registerInitialState(self, gameState)
+        self.ghostModel.clear()
+
+    def getAction(self, gameState: GameState):
+        """
+        Returns the expectimax action using self.depth and self.evaluationFunction
+
+        Each ghost is modeled as choosing its move from the distribution of
+        self.ghostModel.
+        """
+        self.chanceValues = {}
+        self.startMoveStats(gameState)
         bestAction = None
         bestScore = float('-inf')
-        alpha = float('-inf')
-        beta = float('inf')
 
         for action in gameState.getLegalActions(0):
             successor = gameState.generateSuccessor(0, action)
-            score = alphabeta(1, 0, successor, alpha, beta)
+            score = self.expectimax(1, 0, successor)  # Start with Ghost 1, depth 0
             if score > bestScore:
                 bestScore = score
                 bestAction = action
-            alpha = max(alpha, score)
 
+        self.finishMoveStats(gameState, bestAction, depth=self.depth)
         return bestAction
 
-class ExpectimaxAgent(MultiAgentSearchAgent):
-    """
-      Your expectimax agent (question 4)
-    """
+    def expectimax(self, agentIndex, depth, gameState):
+        if self.stats is not None:
+            self.stats.expand(depth * gameState.getNumAgents() + agentIndex)
+
+        # Base case: terminal state or maximum depth reached
+        if gameState.isWin() or gameState.isLose() or depth == self.depth:
+            return self.evaluationFunction(gameState)
+
+        # Pacman's turn (Maximizer)
+        if agentIndex == 0:
+            return self.maxValue(agentIndex, depth, gameState)
+        # Ghost's turn (Chance node)
+        return self.expValue(agentIndex, depth, gameState)
+
+    def maxValue(self, agentIndex, depth, gameState):
+        legalActions = gameState.getLegalActions(agentIndex)
+        if not legalActions:
+            return self.evaluationFunction(gameState)
+
+        v = float('-inf')
+        for action in legalActions:
+            successor = gameState.generateSuccessor(agentIndex, action)
+            v = max(v, self.expectimax(1, depth, successor))
+        return v
+
+    def expValue(self, agentIndex, depth, gameState):
+        # The same position is often reached through different move orders
+        key = (gameState.getZobristKey(), agentIndex, self.depth - depth)
+        v = self.chanceValues.get(key)
+        if self.stats is not None:
+            self.stats.probe('chanceValues', v is not None)
+        if v is not None:
+            return v
 
-    def getAction(self, gameState: GameState):
-        """
-        Returns the expectimax action using self.depth and self.evaluationFunction
+        actions, probabilities = self.ghostModel.distribution(gameState, agentIndex)
+        if not actions:
+            return self.evaluationFunction(gameState)
 
-        All ghosts should be modeled as choosing uniformly at random from their
-        legal moves.
-        """
-        "*** YOUR CODE HERE ***"
-        util.raiseNotDefined()
+        # Determine next agent and depth
+        nextAgent = agentIndex + 1
+        nextDepth = depth
+        if nextAgent == gameState.getNumAgents():
+            nextAgent = 0      # Back to Pacman
+            nextDepth = depth + 1  # New ply begins
+
+        # Value every outcome first, then weight them all at once
+        values = [self.expectimax(nextAgent, nextDepth, gameState.generateSuccessor(agentIndex, action))
+                  for action in actions]
+        v = sum(map(operator.mul, probabilities, values))
+        self.chanceValues[key] = v
+        return v
 
 def betterEvaluationFunction(currentGameState: GameState):
     """
     Your extreme ghost-hunting, pellet-nabbing, food-gobbling, unstoppable
     evaluation function (question 5).
 
-    DESCRIPTION: <write something here so we know what you did>
+    DESCRIPTION: Starts from the game score and adds
+      - the reciprocal of the distance to the closest food, so Pacman heads
+        for food even when none is one step away,
+      - a penalty for every food and capsule still on the board,
+      - a bonus for being close to a scared ghost that can still be reached
+        before its timer runs out,
+      - a large penalty for standing next to a ghost that is not scared.
     """
-    "*** YOUR CODE HERE ***"
-    util.raiseNotDefined()
+    if currentGameState.isWin() or currentGameState.isLose():
+        return currentGameState.getScore()
+
+    position = currentGameState.getPacmanPosition()
+    score = currentGameState.getScore()
+
+    foodPositions = currentGameState.getFoodPositions()
+    if foodPositions:
+        closestFood = min(manhattanDistance(position, food) for food in foodPositions)
+        score += 10.0 / closestFood
+    score -= 4 * len(foodPositions)
+    score -= 20 * len(currentGameState.getCapsules())
+
+    for ghostState in currentGameState.getGhostStates():
+        distance = manhattanDistance(position, ghostState.getPosition())
+        if ghostState.scaredTimer > distance:
+            score += 200.0 / (distance + 1)
+        elif ghostState.scaredTimer == 0 and distance <= 1:
+            score -= 500
+
+    return score
 
 # Abbreviation
 better = betterEvaluationFunction
 
+class MCTSNode:
+    """
+    A Pacman decision in the search tree.  Ghost moves are sampled afresh
+    on every visit (open loop): Pacman's position, and so his legal actions,
+    only depend on his own moves.
+    """
+    __slots__ = ('children', 'untried', 'visits', 'valueSum')
+
+    def __init__(self, legalActions):
+        self.children = {}  # action -> MCTSNode
+        self.untried = list(legalActions)
+        self.visits = 0
+        self.valueSum = 0.0
+
+class MCTSAgent(MultiAgentSearchAgent):
+    """
+    Monte Carlo tree search (UCT) over Pacman's moves.  Ghosts move as
+    DirectionalGhost would, in the tree and in rollouts; in rollouts Pacman
+    moves at random but never stops or turns back unless he has to.  A rollout stops after rolloutDepth
+    Pacman moves or when the game ends, and its last state is scored with
+    evalFn: any evaluation function here, or 'neural' for the NeuralAgent
+    heuristic, with the network run by backend and cacheSize evaluations
+    cached.  The neural evaluation draws its tie-breaking noise from the
+    search's own random.Random, like the rollouts, and prints nothing.
+
+    Every move is searched for timeLimit seconds (and at most iterations
+    iterations, if set).  With workers > 0 each worker process grows its
+    own tree for that time and the root statistics are added up, so more
+    cores mean more rollouts per move.
+    """
+
+    def __init__(self, evalFn = 'scoreEvaluationFunction', timeLimit = '1.0', iterations = '0',
+                 rolloutDepth = '10', exploration = '1.4', workers = '0', seed = '0',
+                 backend = 'torch', cacheSize = '100000'):
+        if evalFn == 'neural':
+            MultiAgentSearchAgent.__init__(self, workers=workers)
+            self.neuralAgent = NeuralAgent("models/pacman_model.pth", backend, cacheSize)
+            self.evaluationFunction = self.neuralEvaluation
+        else:
+            MultiAgentSearchAgent.__init__(self, evalFn, workers=workers)
+            self.neuralAgent = None
+        self.timeLimit = float(timeLimit)
+        self.iterations = int(iterations)
+        self.rolloutDepth = int(rolloutDepth)
+        self.exploration = float(exploration)
+        self.random = random.Random(int(seed))  # Leaves the game's random module alone
+        self.searchRandom = self.random  # The random.Random of the search in progress
+        self.ghostModel = GhostModel('DirectionalGhost')
+        self.iterationCount = 0  # Iterations for the last move, over all workers
+
+    def registerInitialState(self, gameState):
+        MultiAgentSearchAgent.registerInitialState(self, gameState)
+        self.ghostModel.clear()
+        if self.neuralAgent is not None:
+            self.neuralAgent.registerInitialState(gameState)
+
+    def getAction(self, gameState: GameState):
+        """
+        Returns the most visited of Pacman's moves.
+        """
+        self.startMoveStats(gameState)
+        legalActions = gameState.getLegalActions(0)
+        deadline = time.time() + self.timeLimit
+
+        pool = self.getSearchPool()
+        if pool is not None:
+            tasks = [(gameState, deadline, self.random.getrandbits(32), self.gameNumber)
+                     for i in range(pool.numWorkers)]
+            results = pool.map('runSearchInWorker', tasks)
+        else:
+            results = [self.runSearch(gameState, deadline, self.random.getrandbits(32))]
+
+        visits = util.Counter()
+        values = util.Counter()
+        self.iterationCount = 0
+        for iterations, rootStats in results:
+            self.iterationCount += iterations
+            for action, (n, valueSum) in rootStats.items():
+                visits[action] += n
+                values[action] += valueSum
+
+        def rank(action):
+            if visits[action] == 0:
+                return (0, float('-inf'))
+            return (visits[action], values[action] / visits[action])
+        bestAction = max(legalActions, key=rank)
+        self.finishMoveStats(gameState, bestAction, iterations=self.iterationCount)
+        return bestAction
+
+    def runSearchInWorker(self, gameState, deadline, seed, gameNumber):
+        self.prepareWorker(gameState, gameNumber)
+        return self.runSearch(gameState, deadline, seed)
+
+    def runSearch(self, gameState, deadline, seed):
+        """
+        Grows a tree from gameState until the deadline (at least one
+        iteration) and returns (iterations, {action: (visits, valueSum)})
+        for the root's children.
+        """
+        rng = random.Random(seed)
+        self.searchRandom = rng
+        state = gameState.view()  # Moved with apply/undo, never copied
+        root = MCTSNode(state.getLegalActions(0))
+        bounds = [float('inf'), float('-inf')]  # Lowest and highest value seen
+        iterations = 0
+        while True:
+            self.runIteration(state, root, rng, bounds)
+            iterations += 1
+            if time.time() >= deadline or iterations == self.iterations:
+                break
+        return iterations, dict((action, (child.visits, child.valueSum))
+                                for action, child in root.children.items())
+
+    def runIteration(self, state, root, rng, bounds):
+        # Selection and expansion: walk down by UCT until a move not tried yet
+        node = root
+        path = [root]
+        applied = 0
+        while not (state.isWin() or state.isLose()):
+            if node.untried:
+                action = node.untried.pop(rng.randrange(len(node.untried)))
+                applied += self.playRound(state, action, rng)
+                child = MCTSNode(state.getLegalActions(0) if not (state.isWin() or state.isLose()) else [])
+                node.children[action] = child
+                path.append(child)
+                break
+            if not node.children:
+                break
+            action = self.selectAction(node, bounds)
+            applied += self.playRound(state, action, rng)
+            node = node.children[action]
+            path.append(node)
+
+        # Rollout: Pacman wanders without stopping or turning back
+        for i in range(self.rolloutDepth):
+            if state.isWin() or state.isLose():
+                break
+            legalActions = state.getLegalActions(0)
+            reverse = Actions.reverseDirection(state.getPacmanState().getDirection())
+            moves = [action for action in legalActions if action != Directions.STOP and action != reverse]
+            applied += self.playRound(state, rng.choice(moves or legalActions), rng)
+
+        value = self.evaluationFunction(state)
+        for i in range(applied):
+            state.undo()
+
+        # Backpropagation
+        bounds[0] = min(bounds[0], value)
+        bounds[1] = max(bounds[1], value)
+        for node in path:
+            node.visits += 1
+            node.valueSum += value
+
+    def neuralEvaluation(self, state):
+        """
+        NeuralAgent.evaluationFunction, with the noise drawn from the
+        search's random.Random and without printing every score.
+        """
+        neuralAgent = self.neuralAgent
+        if neuralAgent.model is None:
+            return 0
+        score, neural_score = neuralAgent.evaluation_parts([state])[0]
+        return neuralAgent.final_score(score, neural_score, rng=self.searchRandom, verbose=False)
+
+    def selectAction(self, node, bounds):
+        """
+        UCB1, with mean values rescaled to [0, 1] by the values seen so far.
+        """
+        low, high = bounds
+        scale = high - low if high > low else 1.0
+        logVisits = math.log(node.visits)
+        bestAction = None
+        bestScore = float('-inf')
+        for action, child in node.children.items():
+            mean = (child.valueSum / child.visits - low) / scale
+            score = mean + self.exploration * math.sqrt(logVisits / child.visits)
+            if score > bestScore:
+                bestScore = score
+                bestAction = action
+        return bestAction
+
+    def playRound(self, state, action, rng):
+        """
+        Applies Pacman's action and a sampled move for every ghost, and
+        returns how many moves were applied.
+        """
+        state.apply(0, action)
+        applied = 1
+        for agentIndex in range(1, state.getNumAgents()):
+            if state.isWin() or state.isLose():
+                break
+            state.apply(agentIndex, self.ghostModel.sample(state, agentIndex, rng))
+            applied += 1
+        return applied
+
 
 ###########################################################################
 # Ahmed
@@ -389,12 +1404,30 @@ class NeuralAgent(Agent):
     """
     Un agente de Pacman que utiliza una red neuronal para tomar decisiones
     basado en la evaluación del estado del juego.
+
+    Con backend='numpy' la red se evalúa con numpy_net, a partir de los
+    pesos .npz exportados junto al .pth, y torch no llega a importarse.
+
+    Las evaluaciones se guardan en una caché LRU de hasta cacheSize estados
+    (0 la desactiva), por clave Zobrist: posiciones y direcciones de los
+    agentes, tiempos de susto, comida, cápsulas y puntuación, que es todo lo
+    que mira la evaluación.  Se guarda la parte determinista (heurística y
+    aporte de la red); el ruido de desempate se sortea en cada llamada, como
+    antes, así que con o sin caché se juegan las mismas partidas.  La caché
+    se vacía al empezar cada partida.
     """
-    def __init__(self, model_path="models/pacman_model.pth"):
+    def __init__(self, model_path="models/pacman_model.pth", backend='torch', cacheSize='100000'):
         super().__init__()
+        if backend not in ['torch', 'numpy']:
+            raise Exception('Unknown neural backend %s; use torch or numpy' % backend)
+        self.backend = backend
         self.model = None
         self.input_size = None
-        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        if backend == 'torch':
+            import torch
+            self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        else:
+            self.device = 'numpy'
         self.load_model(model_path)
         
         # Mapeo de índices a acciones
@@ -411,6 +1444,20 @@ class NeuralAgent(Agent):
         
         # Contador de movimientos
         self.move_count = 0
+
+        # Pasadas hacia delante de la red (para medir el batching)
+        self.forward_passes = 0
+
+        # Para codificar estados: máscaras de paredes por mapa y buffers reutilizados
+        self._wall_masks = {}
+        self._matrix_buffer = None
+        self._batch_buffer = None
+
+        # Caché de evaluaciones: clave Zobrist -> (heurística, aporte de la red)
+        self.cache_size = int(cacheSize)
+        self.evaluation_cache = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
         
         print(f"NeuralAgent inicializado, usando dispositivo: {self.device}")
 
@@ -420,13 +1467,17 @@ class NeuralAgent(Agent):
             if not os.path.exists(model_path):
                 print(f"ERROR: No se encontró el modelo en {model_path}")
                 return False
-                
+
+            if self.backend == 'numpy':
+                return self.load_numpy_model(model_path)
+
             # Cargar el modelo
+            import torch
             checkpoint = torch.load(model_path, map_location=self.device)
             self.input_size = checkpoint['input_size']
             
             # Crear y cargar el modelo
-            self.model = PacmanNet(self.input_size, 128, 5).to(self.device)
+            self.model = NeuralAgent.import_net().PacmanNet(self.input_size, 128, 5).to(self.device)
             self.model.load_state_dict(checkpoint['model_state_dict'])
             self.model.eval()  # Modo evaluación
             
@@ -437,79 +1488,137 @@ class NeuralAgent(Agent):
             print(f"Error al cargar el modelo: {e}")
             return False
 
-    def state_to_matrix(self, state):
-        """Convierte el estado del juego en una matriz numérica normalizada"""
-        # Obtener dimensiones del tablero
+    def load_numpy_model(self, model_path):
+        """
+        Carga los pesos .npz junto a model_path, exportándolos del .pth la
+        primera vez (lo único que importa torch en este modo).
+        """
+        from numpy_net import NumpyPacmanNet
+        npz_path = os.path.splitext(model_path)[0] + ".npz"
+        if not os.path.exists(npz_path) or os.path.getmtime(npz_path) < os.path.getmtime(model_path):
+            NeuralAgent.import_net().export_numpy(model_path, npz_path)
+        self.model = NumpyPacmanNet(npz_path)
+        self.input_size = self.model.input_size
+        print(f"Modelo cargado correctamente desde {npz_path}")
+        print(f"Tamaño de entrada: {self.input_size}")
+        return True
+
+    @staticmethod
+    def import_net():
+        """
+        Importa net.py, que fija la semilla de random al importarse.  Antes
+        se importaba con este módulo, antes de su propio random.seed(69);
+        ahora se importa al cargar el modelo, así que se conserva el estado
+        de random para que las partidas no cambien.
+        """
+        random_state = random.getstate()
+        import net
+        random.setstate(random_state)
+        return net
+
+    def state_to_matrix(self, state, out=None):
+        """
+        Convierte el estado del juego en una matriz numérica normalizada:
+        0: pared, 1: espacio vacío, 2: comida, 3: cápsula, 4: fantasma,
+        5: Pacman, 6: fantasma asustado, todo dividido entre 6.
+
+        La matriz se escribe en out, o en un buffer del agente que se reutiliza
+        entre llamadas (y que por tanto sobrescribe la anterior).
+        """
         walls = state.getWalls()
         width, height = walls.width, walls.height
-        
-        # Crear una matriz numérica
-        # 0: pared, 1: espacio vacío, 2: comida, 3: cápsula, 4: fantasma, 5: Pacman
-        numeric_map = np.zeros((width, height), dtype=np.float32)
-        
-        # Establecer espacios vacíos (todo lo que no es pared comienza como espacio vacío)
-        for x in range(width):
-            for y in range(height):
-                if not walls[x][y]:
-                    numeric_map[x][y] = 1
-        
-        # Agregar comida
-        food = state.getFood()
-        for x in range(width):
-            for y in range(height):
-                if food[x][y]:
-                    numeric_map[x][y] = 2
-        
-        # Agregar cápsulas
-        for x, y in state.getCapsules():
-            numeric_map[x][y] = 3
-        
-        # Agregar fantasmas
+
+        # Máscara de paredes por mapa: 0 en las paredes, 1 en el resto
+        key = (width, height, walls.bits)
+        base = self._wall_masks.get(key)
+        if base is None:
+            base = self._wall_masks[key] = (~NeuralAgent.grid_to_mask(walls)).astype(np.float32)
+
+        if out is None:
+            if self._matrix_buffer is None or self._matrix_buffer.shape != (width, height):
+                self._matrix_buffer = np.empty((width, height), dtype=np.float32)
+            out = self._matrix_buffer
+
+        # Espacios vacíos y comida (la comida nunca está en una pared)
+        np.add(base, NeuralAgent.grid_to_mask(state.getFood()), out=out)
+
+        # Cápsulas
+        capsules = state.getCapsules()
+        if capsules:
+            xs, ys = zip(*capsules)
+            out[xs, ys] = 3
+
+        # Fantasmas, en orden, por si dos comparten casilla
         for ghost_state in state.getGhostStates():
-            ghost_x, ghost_y = int(ghost_state.getPosition()[0]), int(ghost_state.getPosition()[1])
-            # Si el fantasma está asustado, marcarlo diferente
-            if ghost_state.scaredTimer > 0:
-                numeric_map[ghost_x][ghost_y] = 6  # Fantasma asustado
-            else:
-                numeric_map[ghost_x][ghost_y] = 4  # Fantasma normal
-        
-        # Agregar Pacman
+            ghost_x, ghost_y = ghost_state.getPosition()
+            out[int(ghost_x), int(ghost_y)] = 6 if ghost_state.scaredTimer > 0 else 4
+
+        # Pacman
         pacman_x, pacman_y = state.getPacmanPosition()
-        numeric_map[int(pacman_x)][int(pacman_y)] = 5
-        
+        out[int(pacman_x), int(pacman_y)] = 5
+
         # Normalizar
-        numeric_map = numeric_map / 6.0
-        
-        return numeric_map
-    
-    
+        out /= 6.0
+        return out
+
+    @staticmethod
+    def grid_to_mask(grid):
+        """
+        Devuelve un Grid como array booleano (width, height), leyendo su
+        bitboard de una vez: la casilla (x, y) es el bit x * height + y.
+        """
+        cells = grid.width * grid.height
+        packed = np.frombuffer(grid.bits.to_bytes((cells + 7) // 8, 'little'), dtype=np.uint8)
+        bits = np.unpackbits(packed, count=cells, bitorder='little')
+        return bits.view(bool).reshape(grid.width, grid.height)
+
     from pacman import GameState
     @staticmethod
-    def flood_fill_accessible_area(state, start_pos, max_depth=15):
-        from collections import deque
+    def flood_fill_accessible_area(state, start_pos, max_depth=15, return_reachable=False):
         """
         Cuenta cuántos espacios libres hay accesibles desde start_pos
         sin pasar por paredes ni fantasmas, hasta un cierto nivel de profundidad.
+
+        La búsqueda en anchura avanza toda la frontera a la vez sobre el
+        bitboard de las paredes (ver reachability.py).  Con
+        return_reachable=True devuelve también un Grid con las casillas
+        alcanzadas.
         """
         walls = state.getWalls()
-        ghost_positions = set(state.getGhostPositions())
-        visited = set()
-        queue = deque([(start_pos, 0)])
-        count = 0
-
-        while queue:
-            (x, y), depth = queue.popleft()
-            if (x, y) in visited or walls[x][y] or (x, y) in ghost_positions or depth > max_depth:
-                continue
-            visited.add((x, y))
-            count += 1
-
-            for dx, dy in [(-1,0), (1,0), (0,-1), (0,1)]:
-                next_pos = (x + dx, y + dy)
-                queue.append((next_pos, depth + 1))
-
+        reachability = getReachability(walls)
+        blocked = reachability.blockedBits(state.getGhostPositions())
+        reached = reachability.reachable(start_pos, max_depth, blocked)
+        count = bin(reached).count('1')
+        if return_reachable:
+            grid = Grid(walls.width, walls.height)
+            grid.bits = reached
+            return count, grid
         return count
 
+    def predict(self, states):
+        """
+        Devuelve las probabilidades de acción de la red para una lista de
+        estados, con una sola pasada hacia delante para todo el lote.
+        """
+        walls = states[0].getWalls()
+        shape = (len(states), walls.width, walls.height)
+        if self._batch_buffer is None or self._batch_buffer.shape[0] < shape[0] \
+                or self._batch_buffer.shape[1:] != shape[1:]:
+            self._batch_buffer = np.empty(shape, dtype=np.float32)
+        matrices = self._batch_buffer[:len(states)]
+        for state, matrix in zip(states, matrices):
+            self.state_to_matrix(state, matrix)
+        self.forward_passes += 1
+
+        if self.backend == 'numpy':
+            return self.model.predict_proba(matrices)
+
+        import torch
+        state_tensor = torch.from_numpy(matrices).to(self.device)
+        with torch.no_grad():
+            output = self.model(state_tensor)
+            return torch.nn.functional.softmax(output, dim=1).cpu().numpy()
+
     def evaluationFunction(self, state):
         """
         Evaluación híbrida: red neuronal + heurísticas razonables.
@@ -518,18 +1627,81 @@ class NeuralAgent(Agent):
         if self.model is None:
             return 0  # No hay modelo, evaluación neutra
 
-        # Convertir estado a tensor
-        state_matrix = self.state_to_matrix(state)
-        state_tensor = torch.FloatTensor(state_matrix).unsqueeze(0).to(self.device)
+        score, neural_score = self.evaluation_parts([state])[0]
+        return self.final_score(score, neural_score)
 
-        # Obtener distribución de acciones de la red
-        with torch.no_grad():
-            output = self.model(state_tensor)
-            probabilities = torch.nn.functional.softmax(output, dim=1).cpu().numpy()[0]
+    def evaluate_batch(self, states, batch_size=1024):
+        """
+        Evalúa muchos estados igual que evaluationFunction, pero pasando
+        por la red batch_size estados a la vez.
+        """
+        if self.model is None:
+            return [0] * len(states)
+
+        scores = []
+        for start in range(0, len(states), batch_size):
+            batch = states[start:start + batch_size]
+            scores.extend(self.final_score(score, neural_score)
+                          for score, neural_score in self.evaluation_parts(batch))
+        return scores
+
+    def evaluation_parts(self, states):
+        """
+        Devuelve (heurística, aporte de la red) de cada estado.  Los que no
+        están en la caché pasan juntos por la red, en una sola pasada.
+        """
+        parts = [None] * len(states)
+        missing = list(range(len(states)))
+        cache = self.evaluation_cache
+        if self.cache_size > 0:
+            missing = []
+            for i, state in enumerate(states):
+                key = state.getZobristKey()
+                entry = cache.get(key)
+                if entry is None:
+                    missing.append(i)
+                else:
+                    cache.move_to_end(key)
+                    parts[i] = entry
+            self.cache_hits += len(states) - len(missing)
+            self.cache_misses += len(missing)
+
+        if missing:
+            probabilities = self.predict([states[i] for i in missing])
+            for i, probs in zip(missing, probabilities):
+                state = states[i]
+                parts[i] = (self.heuristic_score(state), sum(prob * 10 for prob in probs))
+                if self.cache_size > 0:
+                    cache[state.getZobristKey()] = parts[i]
+                    if len(cache) > self.cache_size:
+                        cache.popitem(last=False)
+        return parts
+
+    def final_score(self, score, neural_score, rng=None, verbose=True):
+        """
+        Añade el ruido de desempate a la heurística y el aporte de la red.
+        El ruido sale de rng (por defecto, el módulo random), y con
+        verbose=False no se imprime la puntuación.
+        """
+        # Leve ruido aleatorio para evitar empates constantes
+        if rng is None:
+            rng = random
+        score += rng.uniform(0, 1)
 
+        # Aporte de la red neuronal
+        final_score = 0.9 * score + 0.1 * neural_score
+
+        if verbose:
+            print("Final Score:", final_score)
+        return final_score
+
+    def heuristic_score(self, state):
+        """
+        La parte heurística de la evaluación, sin el ruido.
+        """
         legal_actions = state.getLegalActions()
         pacman_pos = state.getPacmanPosition()
-        food_list = state.getFood().asList()
+        food_list = state.getFoodPositions()
         ghost_states = state.getGhostStates()
         num_food = state.getNumFood()
 
@@ -586,20 +1758,18 @@ class NeuralAgent(Agent):
         else:
             score += reachable_area * 0.2
 
-        # Leve ruido aleatorio para evitar empates constantes
-        import random
-        score += random.uniform(0, 1)
+        return score
 
-        # Aporte de la red neuronal
-        neural_score = sum(prob * 10 for prob in probabilities)
-        final_score = 0.9 * score + 0.1 * neural_score
-
-        print("Final Score:", final_score)
-        return final_score
 
 
 
 
+    def registerInitialState(self, state):
+        """
+        Vacía la caché de evaluaciones al empezar cada partida, para que no
+        guarde estados de partidas o mapas anteriores.
+        """
+        self.evaluation_cache.clear()
 
     def getAction(self, state):
         """
@@ -619,12 +1789,7 @@ class NeuralAgent(Agent):
         legal_actions = state.getLegalActions()
         
         # Evaluación directa con la red neuronal
-        state_matrix = self.state_to_matrix(state)
-        state_tensor = torch.FloatTensor(state_matrix).unsqueeze(0).to(self.device)
-        
-        with torch.no_grad():
-            output = self.model(state_tensor)
-            probabilities = torch.nn.functional.softmax(output, dim=1).cpu().numpy()[0]
+        probabilities = self.predict([state])[0]
         
         # Mapear índices del modelo a acciones del juego
         action_probs = []
@@ -212,6 +212,16 @@ def save_model(model, input_size, model_path="models/pacman_model.pth"):
     torch.save(model_info, model_path)
     print(f'Modelo guardado en {model_path}')
 
+def export_numpy(model_path="models/pacman_model.pth", npz_path=None):
+    """Exporta los pesos del checkpoint a un .npz para numpy_net.NumpyPacmanNet"""
+    if npz_path is None:
+        npz_path = os.path.splitext(model_path)[0] + ".npz"
+    checkpoint = torch.load(model_path, map_location='cpu')
+    weights = {name: tensor.cpu().numpy() for name, tensor in checkpoint['model_state_dict'].items()}
+    np.savez(npz_path, input_size=np.array(checkpoint['input_size']), **weights)
+    print(f'Pesos exportados en {npz_path}')
+    return npz_path
+
 def main():
     import time
     start_time = time.time()
@@ -250,4 +260,9 @@ def main():
     save_model(trained_model, input_size)
     print(f"Tiempo total de ejecución: {time.time() - start_time:.2f} segundos")
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    import sys
+    if sys.argv[1:2] == ['--export']:
+        # python net.py --export [modelo.pth [pesos.npz]]
+        export_numpy(*sys.argv[2:4])
+    else:
+        main()
@@ -0,0 +1,44 @@
+"""
+Inferencia de PacmanNet (net.py) solo con NumPy, sin importar torch.
+
+Los pesos se leen de un .npz exportado del checkpoint .pth con
+net.export_numpy (o 'python net.py --export').  La red se usa siempre en
+modo evaluación, así que el dropout no hace nada y la pasada hacia delante
+es fc1 -> ReLU -> fc2 -> ReLU -> fc3.
+"""
+import numpy as np
+
+
+class NumpyPacmanNet:
+    def __init__(self, weights_path):
+        weights = np.load(weights_path)
+        self.input_size = tuple(int(n) for n in weights['input_size'])
+        # Pesos traspuestos una sola vez para multiplicar x @ W
+        self.layers = []
+        for name in ['fc1', 'fc2', 'fc3']:
+            weight = np.ascontiguousarray(weights[name + '.weight'].T, dtype=np.float32)
+            bias = weights[name + '.bias'].astype(np.float32)
+            self.layers.append((weight, bias))
+
+    def forward(self, x):
+        """
+        Devuelve los logits de un lote x de forma (batch, ancho, alto).
+        """
+        x = x.reshape(x.shape[0], -1)
+        last = len(self.layers) - 1
+        for i, (weight, bias) in enumerate(self.layers):
+            x = x @ weight
+            x += bias
+            if i < last:
+                np.maximum(x, 0, out=x)
+        return x
+
+    def predict_proba(self, x):
+        """
+        Softmax de los logits, por filas.
+        """
+        logits = self.forward(x)
+        logits -= logits.max(axis=1, keepdims=True)
+        np.exp(logits, out=logits)
+        logits /= logits.sum(axis=1, keepdims=True)
+        return logits
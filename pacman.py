@@ -43,6 +43,8 @@ from game import GameStateData
 from game import Game
 from game import Directions
 from game import Actions
+from game import Configuration
+from game import Zobrist
 from util import nearestPoint
 from util import manhattanDistance
 import util
@@ -52,6 +54,7 @@ import types
 import time
 import random
 import os
+from searchStats import SearchStatsWriter
 ###################################################
 # Ahmed 
 ###################################################
@@ -86,15 +89,31 @@ class GameState:
     # Accessor methods: use these to access state data #
     ####################################################
 
-    # static variable keeps track of which states have had getLegalActions called
-    explored = set()
+    # static variable holding the ExplorationTracker that generateSuccessor
+    # reports to; exploration tracking is off while it is None
+    explorationTracker = None
+
+    def setExplorationTracker(tracker):
+        GameState.explorationTracker = tracker
+    setExplorationTracker = staticmethod(setExplorationTracker)
 
     def getAndResetExplored():
-        tmp = GameState.explored.copy()
-        GameState.explored = set()
+        tracker = GameState.explorationTracker
+        if tracker == None:
+            return set()
+        tmp = tracker.getExplored()
+        tracker.reset()
         return tmp
     getAndResetExplored = staticmethod(getAndResetExplored)
 
+    # static variable holding the SearchStats (searchStats.py) that
+    # generateSuccessor and apply report their time to, while one is set
+    successorTimer = None
+
+    def setSuccessorTimer(timer):
+        GameState.successorTimer = timer
+    setSuccessorTimer = staticmethod(setSuccessorTimer)
+
     def getLegalActions(self, agentIndex=0):
         """
         Returns the legal actions for the agent specified.
@@ -116,31 +135,72 @@ class GameState:
         if self.isWin() or self.isLose():
             raise Exception('Can\'t generate a successor of a terminal state.')
 
+        timer = GameState.successorTimer
+        if timer != None:
+            start = time.perf_counter()
+
         # Copy current state
         state = GameState(self)
+        state._applyRules(agentIndex, action)
+        if GameState.explorationTracker != None:
+            GameState.explorationTracker.record(self, state)
+        if timer != None:
+            timer.recordSuccessor(time.perf_counter() - start)
+        return state
+
+    def apply(self, agentIndex, action):
+        """
+        Makes the specified agent take the action on this state in place.
+
+        The result is the state generateSuccessor would return, but no new
+        GameState is built.  Every apply must be matched by an undo(), so a
+        search can walk the whole game tree with a single GameState.
+        """
+        if self.isWin() or self.isLose():
+            raise Exception('Can\'t apply an action to a terminal state.')
+
+        timer = GameState.successorTimer
+        if timer != None:
+            start = time.perf_counter()
+
+        if self._undoStack is None:
+            self._undoStack = []
+        self._undoStack.append(self.data.saveChanges())
+        self.data.clearChanges()
+        self._applyRules(agentIndex, action)
+        if timer != None:
+            timer.recordSuccessor(time.perf_counter() - start)
+
+    def undo(self):
+        """
+        Reverts the most recent apply, restoring the score, agent states,
+        scared timers, food, capsules and win/lose flags exactly.
+        """
+        if not self._undoStack:
+            raise Exception('There is no applied action to undo.')
+        self.data.restoreChanges(self._undoStack.pop())
 
+    def _applyRules(self, agentIndex, action):
         # Let agent's logic deal with its action's effects on the board
         if agentIndex == 0:  # Pacman is moving
-            state.data._eaten = [False for i in range(state.getNumAgents())]
-            PacmanRules.applyAction(state, action)
+            self.data._eaten = [False for i in range(self.getNumAgents())]
+            PacmanRules.applyAction(self, action)
         else:                # A ghost is moving
-            GhostRules.applyAction(state, action, agentIndex)
+            GhostRules.applyAction(self, action, agentIndex)
 
         # Time passes
         if agentIndex == 0:
-            state.data.scoreChange += -TIME_PENALTY  # Penalty for waiting around
+            self.data.scoreChange += -TIME_PENALTY  # Penalty for waiting around
         else:
-            GhostRules.decrementTimer(state.data.agentStates[agentIndex])
+            GhostRules.decrementTimer(self.data.mutableAgentState(agentIndex))
 
         # Resolve multi-agent effects
-        GhostRules.checkDeath(state, agentIndex)
+        GhostRules.checkDeath(self, agentIndex)
 
         # Book keeping
-        state.data._agentMoved = agentIndex
-        state.data.score += state.data.scoreChange
-        GameState.explored.add(self)
-        GameState.explored.add(state)
-        return state
+        self.data._agentMoved = agentIndex
+        self.data.score += self.data.scoreChange
+        self.data.rehashChangedAgents()
 
     def getLegalPacmanActions(self):
         return self.getLegalActions(0)
@@ -192,7 +252,16 @@ class GameState:
         return self.data.capsules
 
     def getNumFood(self):
-        return self.data.food.count()
+        return self.data.numFood
+
+    def getFoodPositions(self):
+        """
+        Returns a frozenset of the (x,y) positions that still hold food.
+
+        Unlike getFood().asList() this is kept up to date as food is eaten,
+        so reading it does not scan the food grid.
+        """
+        return self.data.foodPositions
 
     def getFood(self):
         """
@@ -219,10 +288,10 @@ class GameState:
         return self.data.layout.walls
 
     def hasFood(self, x, y):
-        return self.data.food[x][y]
+        return self.data.food.get(x, y)
 
     def hasWall(self, x, y):
-        return self.data.layout.walls[x][y]
+        return self.data.layout.walls.get(x, y)
 
     def isLose(self):
         return self.data._lose
@@ -235,6 +304,9 @@ class GameState:
     # You shouldn't need to call these directly #
     #############################################
 
+    # Changes recorded by apply, created on first use
+    _undoStack = None
+
     def __init__(self, prevState=None):
         """
         Generates a new state by copying information from its predecessor.
@@ -249,6 +321,27 @@ class GameState:
         state.data = self.data.deepCopy()
         return state
 
+    def view(self):
+        """
+        Returns a cheap stand-in for deepCopy().  The copy shares its food,
+        capsules, AgentStates and layout with this state.  Moves replace
+        those objects instead of editing them, so generateSuccessor and
+        apply/undo on either state never show in the other.
+
+        Nothing stops a caller from editing the shared objects themselves,
+        for instance setting a ghost's scaredTimer or a cell of getFood():
+        that would change this state too.  Callers must treat them as
+        read-only.  Game._runHeadless hands agents views of the live state
+        and relies on them doing so.
+        """
+        state = GameState(self)
+        data, original = state.data, self.data
+        data._agentMoved = original._agentMoved
+        data._foodEaten = original._foodEaten
+        data._foodAdded = original._foodAdded
+        data._capsuleEaten = original._capsuleEaten
+        return state
+
     def __eq__(self, other):
         """
         Allows two states to be compared.
@@ -261,6 +354,13 @@ class GameState:
         """
         return hash(self.data)
 
+    def getZobristKey(self):
+        """
+        Returns the 64-bit Zobrist key of this state, which is kept up to date
+        move by move and is suitable for transposition tables and caches.
+        """
+        return self.data.zobristKey()
+
     def __str__(self):
 
         return str(self.data)
@@ -271,6 +371,86 @@ class GameState:
         """
         self.data.initialize(layout, numGhostAgents)
 
+class ExplorationTracker:
+    """
+    Receives every (parent, successor) pair built by
+    GameState.generateSuccessor once installed with
+    GameState.setExplorationTracker.  This base tracker only counts them and
+    keeps no states alive.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.numGenerated = 0
+
+    def record(self, parent, successor):
+        self.numGenerated += 1
+
+    def getExplored(self):
+        """
+        Returns the set of states kept by this tracker.
+        """
+        return set()
+
+    def __str__(self):
+        return "%d successors generated, %d states kept" % (
+            self.numGenerated, len(self.getExplored()))
+
+
+class SampledExplorationTracker(ExplorationTracker):
+    """
+    Counts successors and keeps a uniform sample of at most sampleSize of
+    them (reservoir sampling), so memory stays bounded on long runs.
+    """
+
+    def __init__(self, sampleSize=1000, seed=0):
+        self.sampleSize = sampleSize
+        # A private generator, so sampling never changes the games played
+        self.random = random.Random(seed)
+        ExplorationTracker.__init__(self)
+
+    def reset(self):
+        ExplorationTracker.reset(self)
+        self.sample = []
+
+    def record(self, parent, successor):
+        self.numGenerated += 1
+        if len(self.sample) < self.sampleSize:
+            self.sample.append(successor)
+        else:
+            slot = self.random.randrange(self.numGenerated)
+            if slot < self.sampleSize:
+                self.sample[slot] = successor
+
+    def getExplored(self):
+        return set(self.sample)
+
+
+class FullExplorationTracker(ExplorationTracker):
+    """
+    Keeps every parent and successor state, as GameState.explored used to.
+    Memory grows without bound until reset.
+    """
+
+    def reset(self):
+        ExplorationTracker.reset(self)
+        self.explored = set()
+
+    def record(self, parent, successor):
+        self.numGenerated += 1
+        self.explored.add(parent)
+        self.explored.add(successor)
+
+    def getExplored(self):
+        return set(self.explored)
+
+
+EXPLORATION_TRACKERS = {'count': ExplorationTracker,
+                        'sample': SampledExplorationTracker,
+                        'full': FullExplorationTracker}
+
 ############################################################################
 #                     THE HIDDEN SECRETS OF PACMAN                         #
 #                                                                          #
@@ -296,7 +476,8 @@ class ClassicGameRules:
         agents = [pacmanAgent] + ghostAgents[:layout.getNumGhosts()]
         initState = GameState()
         initState.initialize(layout, len(ghostAgents))
-        game = Game(agents, display, self, catchExceptions=catchExceptions)
+        headless = hasattr(display, 'checkNullDisplay') and display.checkNullDisplay()
+        game = Game(agents, display, self, catchExceptions=catchExceptions, headless=headless)
         game.state = initState
         self.initialState = initState.deepCopy()
         self.quiet = quiet
@@ -357,7 +538,11 @@ class PacmanRules:
         """
         Returns a list of possible actions.
         """
-        return Actions.getPossibleActions(state.getPacmanState().configuration, state.data.layout.walls)
+        conf = state.data.agentStates[0].configuration
+        legal = state.data.layout.pacmanActions.get(conf.pos)
+        if legal is None:
+            return Actions.getPossibleActions(conf, state.data.layout.walls)
+        return list(legal)
     getLegalActions = staticmethod(getLegalActions)
 
     def applyAction(state, action):
@@ -368,7 +553,7 @@ class PacmanRules:
         if action not in legal:
             raise Exception("Illegal action " + str(action))
 
-        pacmanState = state.data.agentStates[0]
+        pacmanState = state.data.mutableAgentState(0)
 
         # Update Configuration
         vector = Actions.directionToVector(action, PacmanRules.PACMAN_SPEED)
@@ -386,23 +571,28 @@ class PacmanRules:
     def consume(position, state):
         x, y = position
         # Eat food
-        if state.data.food[x][y]:
+        if state.data.food.get(x, y):
             state.data.scoreChange += 10
             state.data.food = state.data.food.copy()
             state.data.food[x][y] = False
+            state.data.zobrist ^= Zobrist.foodKey(position)
             state.data._foodEaten = position
-            # TODO: cache numFood?
-            numFood = state.getNumFood()
-            if numFood == 0 and not state.data._lose:
+            state.data.numFood -= 1
+            # The set is shared with the predecessor and with saved changes, so
+            # it is replaced, not edited: copying the remaining food is the
+            # price of that sharing, paid only on moves that eat a pellet.
+            state.data.foodPositions = state.data.foodPositions - {position}
+            if state.data.numFood == 0 and not state.data._lose:
                 state.data.scoreChange += 500
                 state.data._win = True
         # Eat capsule
         if(position in state.getCapsules()):
-            state.data.capsules.remove(position)
+            state.data.capsules = [c for c in state.data.capsules if c != position]
+            state.data.zobrist ^= Zobrist.capsuleKey(position)
             state.data._capsuleEaten = position
             # Reset all ghosts' scared timers
             for index in range(1, len(state.data.agentStates)):
-                state.data.agentStates[index].scaredTimer = SCARED_TIME
+                state.data.mutableAgentState(index).scaredTimer = SCARED_TIME
     consume = staticmethod(consume)
 
 
@@ -418,6 +608,11 @@ class GhostRules:
         reach a dead end, but can turn 90 degrees at intersections.
         """
         conf = state.getGhostState(ghostIndex).configuration
+        legal = state.data.layout.ghostActions.get((conf.pos, conf.direction))
+        if legal is not None:
+            return list(legal)
+
+        # Scared ghosts can stand between grid points
         possibleActions = Actions.getPossibleActions(
             conf, state.data.layout.walls)
         reverse = Actions.reverseDirection(conf.direction)
@@ -434,7 +629,7 @@ class GhostRules:
         if action not in legal:
             raise Exception("Illegal ghost action " + str(action))
 
-        ghostState = state.data.agentStates[ghostIndex]
+        ghostState = state.data.mutableAgentState(ghostIndex)
         speed = GhostRules.GHOST_SPEED
         if ghostState.scaredTimer > 0:
             speed /= 2.0
@@ -446,8 +641,8 @@ class GhostRules:
     def decrementTimer(ghostState):
         timer = ghostState.scaredTimer
         if timer == 1:
-            ghostState.configuration.pos = nearestPoint(
-                ghostState.configuration.pos)
+            ghostState.configuration = Configuration.get(nearestPoint(
+                ghostState.configuration.pos), ghostState.configuration.direction)
         ghostState.scaredTimer = max(0, timer - 1)
     decrementTimer = staticmethod(decrementTimer)
 
@@ -469,9 +664,11 @@ class GhostRules:
     def collide(state, ghostState, agentIndex):
         if ghostState.scaredTimer > 0:
             state.data.scoreChange += 200
+            ghostState = state.data.mutableAgentState(agentIndex)
             GhostRules.placeGhost(state, ghostState)
             ghostState.scaredTimer = 0
             # Added for first-person
+            state.data._eaten = state.data._eaten[:]
             state.data._eaten[agentIndex] = True
         else:
             if not state.data._win:
@@ -574,6 +771,13 @@ def readCommand(argv):
                       help='Turns on exception handling and timeouts during games', default=False)
     parser.add_option('--timeout', dest='timeout', type='int',
                       help=default('Maximum length of time an agent can spend computing in a single game'), default=30)
+    parser.add_option('--exploration', dest='exploration', type='choice',
+                      choices=['none'] + sorted(EXPLORATION_TRACKERS.keys()),
+                      help=default('Track the states generated by search: none, count, sample or full'), default='none')
+    parser.add_option('--explorationSampleSize', dest='explorationSampleSize', type='int',
+                      help=default('How many states the sample exploration tracker keeps'), default=1000)
+    parser.add_option('--searchStats', dest='searchStats',
+                      help='Write statistics for every move of a search agent to this JSON lines file', default=None)
     ###################################################
     # Ahmed 
     ###################################################
@@ -660,6 +864,16 @@ def readCommand(argv):
     args['catchExceptions'] = options.catchExceptions
     args['timeout'] = options.timeout
     args['replay_mode'] = replay_mode
+    if options.searchStats != None:
+        args['searchStats'] = SearchStatsWriter(options.searchStats, options.layout)
+
+    # Choose an exploration tracker
+    if options.exploration == 'sample':
+        GameState.setExplorationTracker(
+            SampledExplorationTracker(options.explorationSampleSize))
+    elif options.exploration != 'none':
+        GameState.setExplorationTracker(
+            EXPLORATION_TRACKERS[options.exploration]())
 
     # Special case: recorded games don't use the runGames method or args structure
     if options.gameToReplay != None:
@@ -726,9 +940,12 @@ def replayGame(layout, actions, display):
     display.finish()
 
 
-def runGames(layout, pacman, ghosts, display, numGames, record, numTraining=0, catchExceptions=False, timeout=30, replay_mode=False):
+def runGames(layout, pacman, ghosts, display, numGames, record, numTraining=0, catchExceptions=False, timeout=30, replay_mode=False,
+             searchStats=None):
     import __main__
     __main__.__dict__['_display'] = display
+    if searchStats != None:
+        searchStats.attach(pacman)
 
     rules = ClassicGameRules(timeout)
     games = []
@@ -774,6 +991,8 @@ def runGames(layout, pacman, ghosts, display, numGames, record, numTraining=0, c
         # Guardar los datos del juego actual
         data_collector.save_game_data(i)
         ###################################################
+        if searchStats != None:
+            searchStats.writeGame(i, pacman)
         if record:
             import time
             import pickle
@@ -794,6 +1013,8 @@ def runGames(layout, pacman, ghosts, display, numGames, record, numTraining=0, c
               (wins.count(True), len(wins), winRate))
         print('Record:       ', ', '.join(
             [['Loss', 'Win'][int(w)] for w in wins]))
+        if GameState.explorationTracker != None:
+            print('Explored:     ', GameState.explorationTracker)
 
     return games
 
@@ -0,0 +1,71 @@
+# parallelSearch.py
+# -----------------
+# A persistent pool of worker processes for the search agents.
+
+"""
+A SearchPool forks a fixed number of worker processes, each holding its own
+copy of a search agent.  Tasks name a method of that agent and its
+arguments, so a search that splits its root moves between workers only
+pays for pickling the game state, not for starting processes or shipping
+the agent (and its evaluation network) on every move.  The pool is meant to
+be created once and kept for as long as the agent plays.
+
+Workers also share one float, alpha: the best root score found so far in
+the current search.  A worker reads it before searching a root move and
+raises it afterwards, so moves searched later prune against the best
+already found, whichever worker found it.
+"""
+
+import atexit
+import multiprocessing
+
+_agent = None
+
+
+def _initWorker(agent, sharedAlpha):
+    global _agent
+    _agent = agent
+    _agent.sharedAlpha = sharedAlpha
+
+
+def _callAgent(task):
+    methodName, args = task
+    return getattr(_agent, methodName)(*args)
+
+
+class SearchPool:
+    """
+    numWorkers processes, each with a copy of agent taken when the pool is
+    created.
+    """
+
+    def __init__(self, agent, numWorkers):
+        self.numWorkers = int(numWorkers)
+        self.sharedAlpha = multiprocessing.Value('d', float('-inf'))
+        self.pool = multiprocessing.Pool(self.numWorkers, _initWorker, (agent, self.sharedAlpha))
+        atexit.register(self.close)
+
+    def setAlpha(self, alpha):
+        with self.sharedAlpha.get_lock():
+            self.sharedAlpha.value = alpha
+
+    def map(self, methodName, argsList):
+        """
+        Calls methodName(*args) on the workers' agents for every args in
+        argsList and returns the results in order.
+        """
+        tasks = [(methodName, args) for args in argsList]
+        return self.pool.map(_callAgent, tasks, chunksize=1)
+
+    def close(self):
+        self.pool.terminate()
+        self.pool.join()
+
+
+def raiseSharedAlpha(sharedAlpha, score):
+    """
+    Raises the shared alpha to score if score is better.
+    """
+    with sharedAlpha.get_lock():
+        if score > sharedAlpha.value:
+            sharedAlpha.value = score
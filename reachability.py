@@ -0,0 +1,82 @@
+# reachability.py
+# ---------------
+# Depth-limited reachability on integer bitboards.
+
+"""
+A Reachability finds the cells reachable from a cell in at most some number
+of steps, without crossing walls or a set of blocked cells, as a bitboard
+laid out like Grid.bits: cell (x, y) is bit x * height + y.
+
+The breadth-first search moves a whole frontier per step.  The neighbours
+of every frontier cell are the frontier shifted by height bits (east and
+west) and by one bit (north and south), so a step is a handful of integer
+operations however many cells the frontier holds.  The north and south
+shifts are masked so a cell at the top of a column does not step onto the
+bottom of the next one.
+
+getReachability keeps one Reachability per wall grid.
+"""
+
+REACHABILITY_CACHE = {}
+
+
+class Reachability:
+
+    def __init__(self, walls):
+        self.width, self.height = walls.width, walls.height
+        height = self.height
+        full = (1 << (self.width * height)) - 1
+        self.open = ~walls.bits & full
+        top = 0
+        for x in range(self.width):
+            top |= 1 << (x * height + height - 1)
+        # Cells that have a cell above them, and cells that have one below
+        self.hasNorth = full & ~top
+        self.hasSouth = full & ~(top >> (height - 1))
+        self.full = full
+
+    def cellBit(self, position):
+        """
+        Returns the bit of a cell, or 0 for positions that are not cells
+        (outside the grid, or halfway between two cells).
+        """
+        x, y = position
+        if x != int(x) or y != int(y):
+            return 0
+        x, y = int(x), int(y)
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return 0
+        return 1 << (x * self.height + y)
+
+    def blockedBits(self, positions):
+        bits = 0
+        for position in positions:
+            bits |= self.cellBit(position)
+        return bits
+
+    def reachable(self, start, maxDepth, blocked=0):
+        """
+        Returns the bitboard of the cells at most maxDepth steps from start
+        through open cells that are not in blocked, start included; 0 if start
+        itself is a wall or blocked.
+        """
+        height = self.height
+        passable = self.open & ~blocked
+        reached = self.cellBit(start) & passable
+        frontier = reached
+        hasNorth, hasSouth = self.hasNorth, self.hasSouth
+        for depth in range(maxDepth):
+            if not frontier:
+                break
+            frontier = ((frontier << height) | (frontier >> height) |
+                        ((frontier & hasNorth) << 1) | ((frontier & hasSouth) >> 1))
+            frontier &= passable & ~reached
+            reached |= frontier
+        return reached
+
+
+def getReachability(walls):
+    key = (walls.width, walls.height, walls.bits)
+    if key not in REACHABILITY_CACHE:
+        REACHABILITY_CACHE[key] = Reachability(walls)
+    return REACHABILITY_CACHE[key]
@@ -0,0 +1,156 @@
+# searchStats.py
+# --------------
+# Per-move statistics for the search agents.
+
+"""
+A SearchStats object follows one move of a search agent: the nodes it
+expanded at every ply below the root (each agent's move is one ply), the
+leaf evaluations and alpha-beta cutoffs, the time spent building successor
+states and evaluating positions, and the lookups in its caches.  record()
+turns it into a plain dict that can be written as one JSON line.
+
+While a move is followed, GameState.generateSuccessor and GameState.apply
+report their time to it (see GameState.setSuccessorTimer) and the agent's
+evaluation function is replaced by a TimedEvaluation.  Work done in worker
+processes is not followed, only the nodes they report back.
+
+Run pacman.py with --searchStats FILE to write a line per move of every game
+to FILE.
+"""
+
+import json
+import time
+
+
+class SearchStats:
+
+    def __init__(self):
+        self.startTime = time.perf_counter()
+        self.nodesPerPly = []
+        self.extraNodes = 0  # Nodes reported back by worker processes
+        self.workerPlies = 0  # How deep the workers searched below the root
+        self.evaluations = 0
+        self.evaluationTime = 0.0
+        self.cutoffs = 0
+        self.successors = 0
+        self.successorTime = 0.0
+        self.caches = {}
+
+    def expand(self, ply):
+        """
+        Counts a node expanded ply agent moves below the root.
+        """
+        nodesPerPly = self.nodesPerPly
+        while len(nodesPerPly) <= ply:
+            nodesPerPly.append(0)
+        nodesPerPly[ply] += 1
+
+    def cutoff(self):
+        self.cutoffs += 1
+
+    def recordSuccessor(self, seconds):
+        self.successors += 1
+        self.successorTime += seconds
+
+    def recordEvaluations(self, count, seconds):
+        self.evaluations += count
+        self.evaluationTime += seconds
+
+    def probe(self, cache, hit):
+        """
+        Counts a lookup in the cache named cache.
+        """
+        counts = self.caches.setdefault(cache, [0, 0])
+        counts[0] += 1
+        if hit:
+            counts[1] += 1
+
+    def addProbes(self, cache, probes, hits):
+        counts = self.caches.setdefault(cache, [0, 0])
+        counts[0] += probes
+        counts[1] += hits
+
+    def branchingFactor(self):
+        """
+        The effective branching factor: the b for which a uniform tree as
+        deep as the search would have as many nodes, b + b^2 + ... + b^d.
+        """
+        nodes = sum(self.nodesPerPly[1:]) + self.extraNodes
+        depth = max(len(self.nodesPerPly) - 1, self.workerPlies)
+        if depth < 1 or nodes == 0:
+            return 0.0
+        low, high = 0.0, float(nodes)
+        for i in range(60):
+            b = (low + high) / 2
+            if sum(b ** k for k in range(1, depth + 1)) < nodes:
+                low = b
+            else:
+                high = b
+        return low
+
+    def record(self, **fields):
+        """
+        Returns the statistics as a dict, with fields added to it.
+        """
+        record = dict(fields)
+        record['time'] = time.perf_counter() - self.startTime
+        record['nodes'] = sum(self.nodesPerPly) + self.extraNodes
+        record['nodesPerPly'] = list(self.nodesPerPly)
+        record['workerNodes'] = self.extraNodes
+        record['leafEvaluations'] = self.evaluations
+        record['cutoffs'] = self.cutoffs
+        record['branchingFactor'] = self.branchingFactor()
+        record['successors'] = self.successors
+        record['successorTime'] = self.successorTime
+        record['evaluationTime'] = self.evaluationTime
+        record['caches'] = dict((cache, {'probes': probes, 'hits': hits,
+                                         'hitRate': hits / float(probes) if probes else 0.0})
+                                for cache, (probes, hits) in self.caches.items())
+        return record
+
+
+class TimedEvaluation:
+    """
+    An evaluation function that reports its calls and their time to a
+    SearchStats.  It is a class rather than a closure so agents holding one
+    can still be sent to worker processes.
+    """
+
+    def __init__(self, evaluationFunction, stats):
+        self.evaluationFunction = evaluationFunction
+        self.stats = stats
+
+    def __call__(self, gameState):
+        start = time.perf_counter()
+        value = self.evaluationFunction(gameState)
+        self.stats.recordEvaluations(1, time.perf_counter() - start)
+        return value
+
+
+class SearchStatsWriter:
+    """
+    Appends the per-move records of a search agent to a JSON lines file,
+    one game at a time.
+    """
+
+    def __init__(self, fileName, layoutName):
+        self.fileName = fileName
+        self.layoutName = layoutName
+        open(fileName, 'w').close()
+
+    def attach(self, agent):
+        """
+        Makes agent record statistics for every move.
+        """
+        if not hasattr(agent, 'collectStats'):
+            raise Exception('%s does not record search statistics' % type(agent).__name__)
+        agent.collectStats = True
+
+    def writeGame(self, gameNumber, agent):
+        f = open(self.fileName, 'a')
+        try:
+            for record in agent.moveStats:
+                record = dict(record, layout=self.layoutName, game=gameNumber)
+                f.write(json.dumps(record) + '\n')
+        finally:
+            f.close()
@@ -0,0 +1,26 @@
+# test_batchGame.py
+# -----------------
+# Checks BatchGameState against the scalar GameState.
+
+import os
+import unittest
+
+import layout
+from batchGame import checkParity
+
+LAYOUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'layouts')
+
+
+class BatchGameParityTest(unittest.TestCase):
+
+    def testParityOnEveryLayout(self):
+        names = sorted(name for name in os.listdir(LAYOUT_DIR) if name.endswith('.lay'))
+        self.assertTrue(names)
+        for name in names:
+            with self.subTest(layout=name):
+                compared = checkParity(layout.getLayout(os.path.join(LAYOUT_DIR, name)))
+                self.assertGreater(compared, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+# transpositionTable.py
+# ---------------------
+# Bounded transposition tables for the adversarial search agents.
+
+"""
+A transposition table remembers the values found for positions already
+searched, so a position reached again through a different move order is not
+searched twice.  Entries are keyed by (Zobrist key of the state, agent to
+move, remaining depth) and hold a value together with a flag saying whether
+it is exact or only a lower or upper bound (alpha-beta searches with a
+window, so a node that fails high or low only bounds its true value).
+
+The table holds at most maxEntries entries.  What happens when it is full is
+set by the eviction policy:
+
+  lru     evict the least recently used entry
+  fifo    evict the oldest entry
+  depth   one slot per hash bucket; keep whichever entry was searched deeper
+  always  one slot per hash bucket; the newest entry always replaces
+
+Entries never go stale (the key covers the whole position and the remaining
+depth), so one table can be kept for a whole game.
+"""
+
+from collections import OrderedDict
+
+EXACT = 'exact'
+LOWER = 'lower'  # the true value is at least the stored value
+UPPER = 'upper'  # the true value is at most the stored value
+
+EVICTION_POLICIES = ['lru', 'fifo', 'depth', 'always']
+
+
+class TranspositionTable:
+    """
+    A bounded map from (stateKey, agentIndex, remainingDepth) to
+    (value, flag), with hit and eviction counters.
+    """
+
+    def __init__(self, maxEntries=100000, policy='lru'):
+        if policy not in EVICTION_POLICIES:
+            raise Exception('Unknown eviction policy %s; use one of %s' %
+                            (policy, ', '.join(EVICTION_POLICIES)))
+        self.maxEntries = int(maxEntries)
+        self.policy = policy
+        self.clear()
+
+    def clear(self):
+        """
+        Drops every entry and resets the counters.
+        """
+        if self.policy in ['lru', 'fifo']:
+            self.entries = OrderedDict()
+        else:
+            self.slots = [None] * self.maxEntries
+            self.numEntries = 0
+        self.resetCounters()
+
+    def resetCounters(self):
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def __len__(self):
+        if self.policy in ['lru', 'fifo']:
+            return len(self.entries)
+        return self.numEntries
+
+    def lookup(self, stateKey, agentIndex, remainingDepth):
+        """
+        Returns the (value, flag) stored for the position, or None.
+        """
+        self.probes += 1
+        key = (stateKey, agentIndex, remainingDepth)
+        if self.policy in ['lru', 'fifo']:
+            entry = self.entries.get(key)
+            if entry is not None and self.policy == 'lru':
+                self.entries.move_to_end(key)
+        else:
+            slot = self.slots[hash(key) % self.maxEntries]
+            entry = slot[1] if slot is not None and slot[0] == key else None
+        if entry is not None:
+            self.hits += 1
+        return entry
+
+    def store(self, stateKey, agentIndex, remainingDepth, value, flag):
+        """
+        Records the value found for the position, evicting an entry if the
+        table is full.
+        """
+        self.stores += 1
+        key = (stateKey, agentIndex, remainingDepth)
+        if self.policy in ['lru', 'fifo']:
+            if key in self.entries:
+                self.entries[key] = (value, flag)
+                if self.policy == 'lru':
+                    self.entries.move_to_end(key)
+                return
+            if len(self.entries) >= self.maxEntries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+            self.entries[key] = (value, flag)
+        else:
+            index = hash(key) % self.maxEntries
+            slot = self.slots[index]
+            if slot is None:
+                self.numEntries += 1
+            elif slot[0] != key:
+                if self.policy == 'depth' and slot[0][2] > remainingDepth:
+                    return
+                self.evictions += 1
+            self.slots[index] = (key, (value, flag))
+
+    def probe(self, stateKey, agentIndex, remainingDepth, alpha, beta):
+        """
+        Returns a stored value that settles the node for the window
+        [alpha, beta]: an exact value, a lower bound above beta or an upper
+        bound below alpha.  Returns None if the node must be searched.
+        """
+        entry = self.lookup(stateKey, agentIndex, remainingDepth)
+        if entry is None:
+            return None
+        value, flag = entry
+        if flag == EXACT or (flag == LOWER and value > beta) or (flag == UPPER and value < alpha):
+            return value
+        return None
+
+    def hitRate(self):
+        if self.probes == 0:
+            return 0.0
+        return self.hits / float(self.probes)
+
+    def getStats(self):
+        return {'entries': len(self), 'probes': self.probes, 'hits': self.hits,
+                'hitRate': self.hitRate(), 'stores': self.stores,
+                'evictions': self.evictions}
+
+    def __str__(self):
+        return "%d entries, %d/%d hits (%.1f%%), %d evictions" % (
+            len(self), self.hits, self.probes, 100 * self.hitRate(), self.evictions)
+
+
+def boundFlag(value, alpha, beta):
+    """
+    Classifies a value returned by a search run with the window
+    [alpha, beta].  The agents prune on strict inequalities, so values on
+    the window edges are exact.
+    """
+    if value < alpha:
+        return UPPER
+    if value > beta:
+        return LOWER
+    return EXACT